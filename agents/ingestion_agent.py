@@ -2,16 +2,25 @@
 Ingestion Agent
 Converts reports, images, and audio into embeddings and stores them
 """
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
+from functools import lru_cache
+from contextlib import nullcontext
+import asyncio
+import mmap
+import multiprocessing
 import uuid
+import zlib
 from datetime import datetime
 import PyPDF2
+import pypdfium2 as pdfium
 import io
 from PIL import Image
 
+from config import settings
 from models.schemas import MedicalRecord, RecordType, Modality, IngestionRequest
 from utils.embeddings import embedding_manager
 from utils.vector_store import qdrant_manager
+from utils.cache import pdf_text_cache, file_key, query_result_cache, unfollowed_index_cache
 
 class IngestionAgent:
     """
@@ -45,15 +54,10 @@ class IngestionAgent:
             
             # Store in Qdrant
             success = qdrant_manager.store_record(
-                patient_id=request.patient_id,
-                record_id=record_id,
-                embedding=embedding,
-                modality=request.modality.value,
-                record_type=request.record_type.value,
-                content=content,
-                date=request.metadata.get("date", datetime.now()),
-                metadata=request.metadata
+                **self._build_record(request, record_id, content, embedding)
             )
+            if success:
+                self._invalidate_patient_caches([request])
             
             if success:
                 return {
@@ -75,25 +79,59 @@ class IngestionAgent:
     
     def _process_text(self, request: IngestionRequest) -> tuple:
         """Process text content"""
+        content, context = self._prepare_text(request)
+        
+        embedding = embedding_manager.embed_medical_text(content, context)
+        
+        return content, embedding
+    
+    def _process_image(self, request: IngestionRequest) -> tuple:
+        """Process medical image (X-ray, scan, etc.)"""
+        content, _ = self._prepare_image(request)
+        
+        # Records are stored with the description's text embedding; the
+        # image pass is skipped until multimodal fusion actually uses it
+        text_embedding = embedding_manager.embed_text(content)
+        
+        return content, text_embedding
+    
+    def _process_audio(self, request: IngestionRequest) -> tuple:
+        """Process audio (doctor voice notes)"""
+        content, _ = self._prepare_audio(request)
+        
+        embedding = embedding_manager.embed_text(content)
+        
+        return content, embedding
+    
+    def _prepare_content(self, request: IngestionRequest) -> tuple:
+        """Extract content and embedding context without embedding it"""
+        if request.modality == Modality.TEXT:
+            return self._prepare_text(request)
+        elif request.modality == Modality.IMAGE:
+            return self._prepare_image(request)
+        elif request.modality == Modality.AUDIO:
+            return self._prepare_audio(request)
+        raise ValueError(f"Unsupported modality: {request.modality}")
+    
+    def _prepare_text(self, request: IngestionRequest) -> tuple:
+        """Prepare text content and its medical context"""
         content = request.content or ""
         
         # If file path provided, extract text from PDF
         if request.file_path and request.file_path.endswith('.pdf'):
             content = self._extract_text_from_pdf(request.file_path)
         
-        # Generate embedding with medical context
+        # Medical context used to enhance the embedding
         context = {
             "symptoms": request.metadata.get("symptoms", []),
             "diagnosis": request.metadata.get("diagnosis"),
             "medications": request.metadata.get("medications", [])
         }
         
-        embedding = embedding_manager.embed_medical_text(content, context)
-        
-        return content, embedding
+        return content, context
     
-    def _process_image(self, request: IngestionRequest) -> tuple:
-        """Process medical image (X-ray, scan, etc.)"""
+    def _prepare_image(self, request: IngestionRequest) -> tuple:
+        """Prepare the text description of a medical image"""
         if not request.file_path:
             raise ValueError("Image file path required")
         
@@ -106,17 +144,10 @@ class IngestionAgent:
         if request.metadata.get("body_part"):
             content += f" of {request.metadata['body_part']}"
         
-        # Generate image embedding
-        image_embedding = embedding_manager.embed_image(request.file_path)
-        
-        # Also generate text embedding for the description
-        text_embedding = embedding_manager.embed_text(content)
-        
-        # For now, use text embedding (in production, use multimodal fusion)
-        return content, text_embedding
+        return content, None
     
-    def _process_audio(self, request: IngestionRequest) -> tuple:
-        """Process audio (doctor voice notes)"""
+    def _prepare_audio(self, request: IngestionRequest) -> tuple:
+        """Prepare audio transcription content"""
         # In production, use Whisper to transcribe
         # For demo, assume transcription is provided
         content = request.content or "Audio transcription not available"
@@ -124,36 +155,153 @@ class IngestionAgent:
         if request.metadata.get("transcription"):
             content = request.metadata["transcription"]
         
-        embedding = embedding_manager.embed_text(content)
+        return content, None
+    
+    def _build_record(
+        self,
+        request: IngestionRequest,
+        record_id: str,
+        content: str,
+        embedding
+    ) -> Dict[str, Any]:
+        """Build the keyword arguments for storing a record in Qdrant"""
+        date = request.metadata.get("date", datetime.now())
+        if isinstance(date, str):
+            date = datetime.fromisoformat(date)
         
-        return content, embedding
+        return {
+            "patient_id": request.patient_id,
+            "record_id": record_id,
+            "embedding": embedding,
+            "modality": request.modality.value,
+            "record_type": request.record_type.value,
+            "content": content,
+            "date": date,
+            "metadata": request.metadata
+        }
     
     def _extract_text_from_pdf(self, pdf_path: str) -> str:
-        """Extract text from PDF file"""
+        """Extract text from PDF file, reusing earlier extractions of identical files"""
+        try:
+            cache_key = file_key(pdf_path)
+        except OSError as e:
+            print(f"Error extracting text from PDF: {e}")
+            return ""
+        
+        text = pdf_text_cache.get(cache_key)
+        if text is None:
+            text = self._extract_text_with_pdfium(pdf_path)
+            # Empty text may be a failed read, so the next ingest tries again
+            if text:
+                pdf_text_cache.set(cache_key, text)
+        
+        return text
+    
+    def _extract_text_with_pdfium(self, pdf_path: str) -> str:
+        """Extract text from PDF file using PDFium's compiled text parser"""
+        try:
+            pdf = pdfium.PdfDocument(pdf_path)
+            try:
+                pages = []
+                for page in pdf:
+                    textpage = page.get_textpage()
+                    pages.append(textpage.get_text_range())
+                    # Release native page handles as soon as the text is read
+                    textpage.close()
+                    page.close()
+                return "\n".join(pages).strip()
+            finally:
+                pdf.close()
+        except Exception as e:
+            print(f"PDFium could not read PDF, falling back to PyPDF2: {e}")
+            return self._extract_text_with_pypdf2(pdf_path)
+    
+    def _extract_text_with_pypdf2(self, pdf_path: str) -> str:
+        """Extract text from PDF file with the pure-Python PyPDF2 parser"""
         try:
-            with open(pdf_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                text = ""
-                for page in pdf_reader.pages:
-                    text += page.extract_text()
-                return text.strip()
+            # Memory-map the file so the OS pages in only what the parser reads
+            with open(pdf_path, 'rb') as file, \
+                    mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as pdf_map:
+                pdf_reader = PyPDF2.PdfReader(pdf_map)
+                # Collect pages and join once instead of re-copying on every +=
+                pages = [page.extract_text() or "" for page in pdf_reader.pages]
+                return "".join(pages).strip()
         except Exception as e:
             print(f"Error extracting text from PDF: {e}")
             return ""
     
-    def batch_ingest(self, requests: list) -> Dict[str, Any]:
-        """Ingest multiple records in batch"""
+    def batch_ingest(
+        self,
+        requests: list,
+        bulk: bool = False,
+        n_workers: int = 1
+    ) -> Dict[str, Any]:
+        """
+        Ingest multiple records in batch
+        All contents are embedded in one model call and stored with
+        batched upserts instead of one round-trip per record
+        
+        Args:
+            bulk: Pause vector indexing and stream records without waiting
+                for each write (for historical backfills)
+            n_workers: Worker processes to shard the batch across by patient
+                (Qdrant server mode only; scripts must guard with __main__)
+        """
+        if n_workers > 1:
+            return self._parallel_batch_ingest(requests, bulk, n_workers)
+        
         results = {
             "success": [],
             "failed": []
         }
         
+        prepared, records, error = self._embed_batch(requests, results)
+        
+        if records:
+            try:
+                if bulk:
+                    with qdrant_manager.bulk_load():
+                        stored = qdrant_manager.store_records_bulk(records)
+                else:
+                    stored = qdrant_manager.store_records(records)
+            except Exception as e:
+                print(f"Error during bulk load: {e}")
+                stored = False
+            if not stored:
+                error = "Failed to store in vector database"
+        
+        return self._summarize_batch(requests, results, prepared, records, error)
+    
+    def _parallel_batch_ingest(
+        self,
+        requests: list,
+        bulk: bool,
+        n_workers: int
+    ) -> Dict[str, Any]:
+        """Shard a batch by patient and ingest each shard in its own process"""
+        if settings.QDRANT_IN_MEMORY:
+            # Worker processes would each write to their own private store
+            print("In-memory Qdrant cannot be shared across processes, ingesting in one process")
+            return self.batch_ingest(requests, bulk=bulk)
+        
+        # crc32 rather than hash() so sharding is stable across processes
+        shards = [[] for _ in range(n_workers)]
         for request in requests:
-            result = self.ingest_record(request)
-            if result["success"]:
-                results["success"].append(result)
-            else:
-                results["failed"].append(result)
+            shards[zlib.crc32(request.patient_id.encode("utf-8")) % n_workers].append(request)
+        shards = [shard for shard in shards if shard]
+        
+        # Indexing is paused once here so no worker restores it while others load
+        with qdrant_manager.bulk_load() if bulk else nullcontext():
+            with multiprocessing.get_context("spawn").Pool(len(shards)) as pool:
+                summaries = pool.map(_ingest_shard, shards)
+        
+        # The workers cleared their own caches; this process holds its own copies
+        self._invalidate_patient_caches(requests)
+        
+        results = {
+            "success": [result for summary in summaries for result in summary["results"]["success"]],
+            "failed": [result for summary in summaries for result in summary["results"]["failed"]]
+        }
         
         return {
             "total": len(requests),
@@ -161,6 +309,165 @@ class IngestionAgent:
             "failed_count": len(results["failed"]),
             "results": results
         }
+    
+    async def abatch_ingest(
+        self,
+        requests: list,
+        concurrency: int = 4,
+        bulk: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Ingest multiple records in batch without blocking the event loop
+        Upsert batches are sent concurrently when a Qdrant server is used
+        """
+        results = {
+            "success": [],
+            "failed": []
+        }
+        
+        # Embedding is CPU/GPU bound, keep it off the event loop
+        prepared, records, error = await asyncio.to_thread(
+            self._embed_batch, requests, results
+        )
+        
+        if records:
+            try:
+                with qdrant_manager.bulk_load() if bulk else nullcontext():
+                    stored = await qdrant_manager.astore_records(records, concurrency=concurrency)
+            except Exception as e:
+                print(f"Error during bulk load: {e}")
+                stored = False
+            if not stored:
+                error = "Failed to store in vector database"
+        
+        # A failed batch is retried record by record, which embeds again
+        return await asyncio.to_thread(
+            self._summarize_batch, requests, results, prepared, records, error
+        )
+    
+    def _embed_batch(self, requests: list, results: Dict[str, list]) -> tuple:
+        """
+        Prepare and embed a batch of requests in one model call
+        Requests that cannot be prepared are added to results["failed"]
+        """
+        # Extract content up front (including PDFs) so embedding is pure compute
+        prepared = []
+        for request in requests:
+            try:
+                content, context = self._prepare_content(request)
+                prepared.append((request, content, context))
+            except Exception as e:
+                results["failed"].append({
+                    "success": False,
+                    "error": str(e)
+                })
+        
+        if not prepared:
+            return prepared, [], None
+        
+        try:
+            embeddings = embedding_manager.embed_medical_texts(
+                [content for _, content, _ in prepared],
+                [context for _, _, context in prepared]
+            )
+        except Exception as e:
+            return prepared, [], str(e)
+        
+        records = [
+            self._build_record(request, str(uuid.uuid4()), content, embedding)
+            for (request, content, _), embedding in zip(prepared, embeddings)
+        ]
+        
+        return prepared, records, None
+    
+    def _ingest_each(
+        self,
+        prepared: list,
+        records: List[Dict[str, Any]],
+        results: Dict[str, list],
+        error: str
+    ):
+        """
+        Retry a failed batch one record at a time so a bad record fails alone
+        Records that were already embedded keep their record IDs, which are
+        also their point IDs, so re-storing a chunk the batch upsert already
+        wrote overwrites it instead of duplicating it
+        """
+        print(f"Batch ingest failed ({error}), retrying record by record")
+        for i, (request, content, context) in enumerate(prepared):
+            try:
+                if records:
+                    record = records[i]
+                else:
+                    embedding = embedding_manager.embed_medical_texts([content], [context])[0]
+                    record = self._build_record(request, str(uuid.uuid4()), content, embedding)
+                
+                if not qdrant_manager.store_record(**record):
+                    raise RuntimeError("Failed to store in vector database")
+                results["success"].append({
+                    "success": True,
+                    "record_id": record["record_id"],
+                    "message": f"Successfully ingested {request.record_type.value}"
+                })
+            except Exception as e:
+                results["failed"].append({
+                    "success": False,
+                    "error": str(e)
+                })
+    
+    def _invalidate_patient_caches(self, requests: list):
+        """Drop cached answers and unfollowed indexes of patients that got new records"""
+        for patient_id in {request.patient_id for request in requests}:
+            query_result_cache.invalidate(patient_id)
+            unfollowed_index_cache.delete(patient_id)
+    
+    def _summarize_batch(
+        self,
+        requests: list,
+        results: Dict[str, list],
+        prepared: list,
+        records: List[Dict[str, Any]],
+        error: Optional[str]
+    ) -> Dict[str, Any]:
+        """
+        Collect per-record outcomes of a batch into the batch summary
+        If the batch failed, its records are retried one at a time first
+        """
+        if error is None:
+            for (request, _, _), record in zip(prepared, records):
+                results["success"].append({
+                    "success": True,
+                    "record_id": record["record_id"],
+                    "message": f"Successfully ingested {request.record_type.value}"
+                })
+        else:
+            self._ingest_each(prepared, records, results, error)
+        
+        # New records can change the answer to any cached query
+        if results["success"]:
+            self._invalidate_patient_caches(requests)
+        
+        return {
+            "total": len(requests),
+            "success_count": len(results["success"]),
+            "failed_count": len(results["failed"]),
+            "results": results
+        }
+
+def _ingest_shard(requests: list) -> Dict[str, Any]:
+    """Ingest one shard of a parallel batch inside a worker process"""
+    # Each worker opens its own Qdrant client
+    qdrant_manager.initialize()
+    return get_ingestion_agent().batch_ingest(requests)
+
+# Global instance, created on first use
+@lru_cache(maxsize=1)
+def get_ingestion_agent() -> IngestionAgent:
+    """Get the shared Ingestion Agent instance"""
+    return IngestionAgent()
 
-# Global instance
-ingestion_agent = IngestionAgent()
+def __getattr__(name: str):
+    # Keeps `from agents.ingestion_agent import ingestion_agent` working lazily
+    if name == "ingestion_agent":
+        return get_ingestion_agent()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -6,7 +6,10 @@ Manages and maintains long-term patient medical memory
 - Memory consolidation
 """
 from typing import Dict, Any, List, Optional
+from functools import lru_cache
+from collections import Counter
 from datetime import datetime, timedelta
+import numpy as np
 from utils.vector_store import qdrant_manager
 
 class PatientMemoryAgent:
@@ -23,45 +26,31 @@ class PatientMemoryAgent:
     def get_patient_memory_summary(self, patient_id: str) -> Dict[str, Any]:
         """Get a summary of patient's medical memory"""
         try:
-            # Get all timeline records
-            timeline = qdrant_manager.get_patient_timeline(patient_id)
+            # Get all timeline records as columns
+            timeline = qdrant_manager.get_patient_timeline_columnar(patient_id)
             
-            if not timeline:
+            if not timeline["payload"]:
                 return {
                     "patient_id": patient_id,
                     "total_records": 0,
                     "message": "No medical history found"
                 }
             
-            # Analyze records
-            record_types = {}
-            date_range = {
-                "earliest": None,
-                "latest": None
-            }
+            # Count records by type
+            record_types = Counter(timeline["record_type"])
             
-            for record in timeline:
-                payload = record["payload"]
-                
-                # Count by type
-                record_type = payload.get("record_type", "unknown")
-                record_types[record_type] = record_types.get(record_type, 0) + 1
-                
-                # Track date range
-                record_date = datetime.fromisoformat(payload["date"])
-                if date_range["earliest"] is None or record_date < date_range["earliest"]:
-                    date_range["earliest"] = record_date
-                if date_range["latest"] is None or record_date > date_range["latest"]:
-                    date_range["latest"] = record_date
+            dates = timeline["date"]
+            earliest = dates.min().item()
+            latest = dates.max().item()
             
             return {
                 "patient_id": patient_id,
-                "total_records": len(timeline),
-                "record_types": record_types,
+                "total_records": len(timeline["payload"]),
+                "record_types": dict(record_types),
                 "date_range": {
-                    "earliest": date_range["earliest"].isoformat() if date_range["earliest"] else None,
-                    "latest": date_range["latest"].isoformat() if date_range["latest"] else None,
-                    "span_days": (date_range["latest"] - date_range["earliest"]).days if date_range["earliest"] and date_range["latest"] else 0
+                    "earliest": earliest.isoformat(),
+                    "latest": latest.isoformat(),
+                    "span_days": (latest - earliest).days
                 },
                 "memory_health": self._assess_memory_health(timeline)
             }
@@ -72,32 +61,28 @@ class PatientMemoryAgent:
                 "error": str(e)
             }
     
-    def _assess_memory_health(self, timeline: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """Assess the health and quality of patient memory"""
-        if not timeline:
+    def _assess_memory_health(self, timeline: Dict[str, Any]) -> Dict[str, Any]:
+        """Assess the health and quality of patient memory from a columnar timeline"""
+        dates = timeline["date"]
+        if not len(dates):
             return {"status": "empty", "score": 0}
         
         # Calculate various health metrics
-        total_records = len(timeline)
+        total_records = len(dates)
+        one_day = np.timedelta64(1, "D")
         
         # Recency score (more recent records = better)
-        now = datetime.now()
-        recent_count = sum(
-            1 for record in timeline
-            if (now - datetime.fromisoformat(record["payload"]["date"])).days <= 90
-        )
+        now = np.datetime64(datetime.now(), "us")
+        recent_count = int(((now - dates) // one_day <= 90).sum())
         recency_score = min(1.0, recent_count / max(1, total_records * 0.3))
         
         # Diversity score (different types of records = better)
-        record_types = set(record["payload"].get("record_type") for record in timeline)
+        record_types = set(timeline["record_type"])
         diversity_score = min(1.0, len(record_types) / 5.0)  # 5 different types is ideal
         
         # Continuity score (regular updates = better)
-        if len(timeline) > 1:
-            dates = sorted([datetime.fromisoformat(r["payload"]["date"]) for r in timeline])
-            avg_gap = sum(
-                (dates[i+1] - dates[i]).days for i in range(len(dates)-1)
-            ) / (len(dates) - 1)
+        if total_records > 1:
+            avg_gap = float((np.diff(np.sort(dates)) // one_day).mean())
             continuity_score = max(0, 1.0 - (avg_gap / 180))  # Ideal: updates every 6 months
         else:
             continuity_score = 0.5
@@ -157,34 +142,29 @@ class PatientMemoryAgent:
             end_date = datetime.now()
             start_date = end_date - timedelta(days=time_window_days)
             
-            records = qdrant_manager.get_patient_timeline(
+            records = qdrant_manager.get_patient_timeline_columnar(
                 patient_id=patient_id,
                 start_date=start_date,
                 end_date=end_date
             )
             
-            # Group by record type
-            grouped = {}
-            for record in records:
-                record_type = record["payload"].get("record_type", "unknown")
-                if record_type not in grouped:
-                    grouped[record_type] = []
-                grouped[record_type].append(record)
+            # Count by record type
+            type_counts = Counter(records["record_type"])
             
             # Find patterns
             patterns = []
-            for record_type, type_records in grouped.items():
-                if len(type_records) >= 3:  # Pattern threshold
+            for record_type, count in type_counts.items():
+                if count >= 3:  # Pattern threshold
                     patterns.append({
                         "type": record_type,
-                        "count": len(type_records),
-                        "pattern": f"Recurring {record_type} records ({len(type_records)} occurrences in {time_window_days} days)"
+                        "count": count,
+                        "pattern": f"Recurring {record_type} records ({count} occurrences in {time_window_days} days)"
                     })
             
             return {
                 "success": True,
                 "time_window_days": time_window_days,
-                "total_records": len(records),
+                "total_records": len(records["payload"]),
                 "patterns_found": len(patterns),
                 "patterns": patterns
             }
@@ -195,5 +175,14 @@ class PatientMemoryAgent:
                 "error": str(e)
             }
 
-# Global instance
-memory_agent = PatientMemoryAgent()
+# Global instance, created on first use
+@lru_cache(maxsize=1)
+def get_memory_agent() -> PatientMemoryAgent:
+    """Get the shared Patient Memory Agent instance"""
+    return PatientMemoryAgent()
+
+def __getattr__(name: str):
+    # Keeps `from agents.memory_agent import memory_agent` working lazily
+    if name == "memory_agent":
+        return get_memory_agent()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
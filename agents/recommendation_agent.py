@@ -3,10 +3,30 @@ Recommendation Agent
 Generates patient-friendly recommendations and questions for doctors
 Focus on actionable, non-diagnostic suggestions
 """
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Set
+from functools import lru_cache
+from collections import Counter
 from datetime import datetime, timedelta
+import re
+import numpy as np
 from utils.llm import gemini_llm
 
+# Query topics and the keywords that signal them (case-insensitive substring match)
+QUERY_TOPIC_KEYWORDS = {
+    "pain": ("pain",),
+    "symptom": ("symptom",),
+    "headache": ("headache", "migraine"),
+    "sleep": ("sleep", "insomnia", "tired"),
+    "allergy": ("allergy", "allergic", "reaction"),
+    "family_history": ("family", "genetic", "hereditary"),
+    "medication": ("medication", "medicine", "drug"),
+}
+
+QUERY_TOPIC_PATTERNS = {
+    topic: re.compile("|".join(map(re.escape, keywords)), re.IGNORECASE)
+    for topic, keywords in QUERY_TOPIC_KEYWORDS.items()
+}
+
 class RecommendationAgent:
     """
     Agent responsible for generating actionable recommendations
@@ -30,9 +50,12 @@ class RecommendationAgent:
         try:
             recommendations = []
             
+            # Scan the query once for every topic the generators react to
+            query_topics = self.detect_query_topics(query)
+            
             # Generate doctor questions
             doctor_questions = self._generate_doctor_questions(
-                query, similar_cases, forgotten_insights
+                query_topics, similar_cases, forgotten_insights
             )
             recommendations.extend([
                 {"type": "doctor_question", "text": q}
@@ -41,7 +64,7 @@ class RecommendationAgent:
             
             # Generate monitoring suggestions
             monitoring = self._generate_monitoring_suggestions(
-                query, similar_cases
+                query_topics, similar_cases
             )
             recommendations.extend([
                 {"type": "self_monitoring", "text": m}
@@ -56,24 +79,30 @@ class RecommendationAgent:
             ])
             
             # Generate information gathering actions
-            info_actions = self._generate_info_actions(query, similar_cases)
+            info_actions = self._generate_info_actions(query_topics, similar_cases)
             recommendations.extend([
                 {"type": "information", "text": a}
                 for a in info_actions
             ])
             
-            # Use LLM for additional context-aware recommendations
-            llm_recommendations = gemini_llm.generate_recommendations(
-                query, timeline_context
-            )
+            # Use LLM for additional context-aware recommendations, unless the
+            # local suggestions already fill the 10 returned slots
+            if len(recommendations) >= 10:
+                llm_recommendations = []
+            else:
+                llm_recommendations = gemini_llm.generate_recommendations(
+                    query, timeline_context
+                )
             
             # Merge LLM recommendations
+            existing = {r["text"] for r in recommendations}
             for rec in llm_recommendations:
-                if rec and rec not in [r["text"] for r in recommendations]:
+                if rec and rec not in existing:
                     recommendations.append({
                         "type": "general",
                         "text": rec
                     })
+                    existing.add(rec)
             
             return {
                 "success": True,
@@ -89,9 +118,16 @@ class RecommendationAgent:
                 "recommendations": []
             }
     
+    def detect_query_topics(self, query: str) -> Set[str]:
+        """Detect which recommendation topics a query mentions"""
+        return {
+            topic for topic, pattern in QUERY_TOPIC_PATTERNS.items()
+            if pattern.search(query)
+        }
+    
     def _generate_doctor_questions(
         self,
-        query: str,
+        query_topics: Set[str],
         similar_cases: List[Dict[str, Any]],
         forgotten_insights: List[str]
     ) -> List[str]:
@@ -129,12 +165,12 @@ class RecommendationAgent:
             )
         
         # General contextual questions
-        if "pain" in query.lower():
+        if "pain" in query_topics:
             questions.append(
                 "What tests or examinations would help determine the cause of this pain?"
             )
         
-        if "symptom" in query.lower():
+        if "symptom" in query_topics:
             questions.append(
                 "What warning signs should I watch for that would require immediate attention?"
             )
@@ -143,7 +179,7 @@ class RecommendationAgent:
     
     def _generate_monitoring_suggestions(
         self,
-        query: str,
+        query_topics: Set[str],
         similar_cases: List[Dict[str, Any]]
     ) -> List[str]:
         """Generate self-monitoring suggestions"""
@@ -161,19 +197,17 @@ class RecommendationAgent:
             )
         
         # Specific monitoring based on query
-        query_lower = query.lower()
-        
-        if "pain" in query_lower:
+        if "pain" in query_topics:
             suggestions.append(
                 "Rate your pain on a scale of 1-10 and note what activities make it better or worse"
             )
         
-        if any(word in query_lower for word in ["headache", "migraine"]):
+        if "headache" in query_topics:
             suggestions.append(
                 "Keep a headache diary tracking possible triggers (food, sleep, stress, weather)"
             )
         
-        if any(word in query_lower for word in ["sleep", "insomnia", "tired"]):
+        if "sleep" in query_topics:
             suggestions.append(
                 "Track your sleep patterns including hours slept, wake times, and sleep quality"
             )
@@ -190,16 +224,15 @@ class RecommendationAgent:
         if not timeline_context:
             return reminders
         
-        # Check for recent records
-        latest_record = max(
-            timeline_context,
-            key=lambda x: x.get("date", ""),
-            default=None
+        # Check for recent records (ISO-8601 dates order lexicographically,
+        # so the latest can be found on the strings and parsed only once)
+        latest_date = max(
+            (record.get("date", "") for record in timeline_context),
+            default=""
         )
         
-        if latest_record:
-            latest_date = datetime.fromisoformat(latest_record["date"])
-            days_since = (datetime.now() - latest_date).days
+        if latest_date:
+            days_since = (datetime.now() - datetime.fromisoformat(latest_date)).days
             
             if days_since > 90:
                 reminders.append(
@@ -221,7 +254,7 @@ class RecommendationAgent:
     
     def _generate_info_actions(
         self,
-        query: str,
+        query_topics: Set[str],
         similar_cases: List[Dict[str, Any]]
     ) -> List[str]:
         """Generate information gathering actions"""
@@ -234,19 +267,17 @@ class RecommendationAgent:
             )
         
         # Suggest specific information to gather
-        query_lower = query.lower()
-        
-        if any(word in query_lower for word in ["allergy", "allergic", "reaction"]):
+        if "allergy" in query_topics:
             actions.append(
                 "Document all known allergies and any adverse reactions to medications or foods"
             )
         
-        if any(word in query_lower for word in ["family", "genetic", "hereditary"]):
+        if "family_history" in query_topics:
             actions.append(
                 "Gather family medical history, especially for conditions that run in families"
             )
         
-        if any(word in query_lower for word in ["medication", "medicine", "drug"]):
+        if "medication" in query_topics:
             actions.append(
                 "Create a complete list of all medications, dosages, and when you started taking them"
             )
@@ -289,11 +320,11 @@ class RecommendationAgent:
         
         # Analyze frequency
         if len(timeline) >= 5:
-            dates = [datetime.fromisoformat(t["date"]) for t in timeline]
-            dates.sort()
+            # Span only needs the extremes, so skip sorting and per-record parsing
+            dates = np.array([t["date"] for t in timeline], dtype="datetime64[us]")
             
             if len(dates) > 1:
-                span = (dates[-1] - dates[0]).days
+                span = int((dates.max() - dates.min()) // np.timedelta64(1, "D"))
                 avg_frequency = span / len(dates) if span > 0 else 0
                 
                 if avg_frequency < 30:
@@ -308,12 +339,9 @@ class RecommendationAgent:
                     })
         
         # Analyze record types
-        record_types = {}
-        for record in timeline:
-            r_type = record.get("record_type", "unknown")
-            record_types[r_type] = record_types.get(r_type, 0) + 1
+        record_types = Counter(record.get("record_type", "unknown") for record in timeline)
         
-        if record_types.get("symptom", 0) > record_types.get("report", 0):
+        if record_types["symptom"] > record_types["report"]:
             insights.append({
                 "type": "documentation",
                 "text": "You track symptoms well. Consider uploading more medical reports for complete context."
@@ -324,7 +352,7 @@ class RecommendationAgent:
             "insights": insights,
             "timeline_summary": {
                 "total_records": len(timeline),
-                "record_types": record_types,
+                "record_types": dict(record_types),
                 "date_range": {
                     "start": min([t["date"] for t in timeline]),
                     "end": max([t["date"] for t in timeline])
@@ -332,5 +360,14 @@ class RecommendationAgent:
             }
         }
 
-# Global instance
-recommendation_agent = RecommendationAgent()
+# Global instance, created on first use
+@lru_cache(maxsize=1)
+def get_recommendation_agent() -> RecommendationAgent:
+    """Get the shared Recommendation Agent instance"""
+    return RecommendationAgent()
+
+def __getattr__(name: str):
+    # Keeps `from agents.recommendation_agent import recommendation_agent` working lazily
+    if name == "recommendation_agent":
+        return get_recommendation_agent()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
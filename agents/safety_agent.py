@@ -3,9 +3,73 @@ Safety & Ethics Agent
 Ensures all outputs are safe, explainable, and non-diagnostic
 Critical for healthcare applications
 """
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Set, Tuple
 import re
 
+# Fixed notices, built once and shared by every call
+PRIVACY_NOTICE = (
+    "Your medical data is stored securely and isolated to your patient ID. "
+    "This system can be deployed locally for complete privacy control."
+)
+
+CONSENT_NOTICE = """
+INFORMED CONSENT & DISCLAIMER
+
+By using CareLedger, you acknowledge that:
+
+1. This system provides DECISION SUPPORT ONLY, not medical diagnosis or treatment
+2. All information should be reviewed with qualified healthcare providers
+3. This system does not replace professional medical advice
+4. In emergencies, contact emergency services immediately
+5. Your medical data is stored securely but you should maintain original records
+6. The AI may make errors - always verify important information with your doctor
+
+This system is designed to help you and your healthcare providers make better-informed 
+decisions by maintaining a comprehensive medical history, but it is not a substitute 
+for professional medical judgment.
+"""
+
+DATA_USAGE_POLICY = """
+DATA USAGE POLICY
+
+- Your medical records are isolated to your patient ID
+- No data is shared with third parties
+- Embeddings are derived from your records but cannot reconstruct original data
+- You can request deletion of all your data at any time
+- System can be deployed locally for complete privacy control
+- AI processing uses your data only for your own medical memory
+"""
+
+def _compile_keywords(keywords: Tuple[str, ...]) -> re.Pattern:
+    """Compile keywords into one case-insensitive pattern that finds every hit in a single pass"""
+    # The lookahead reports a match at each position, so overlapping keywords are all found
+    return re.compile("(?=(" + "|".join(map(re.escape, keywords)) + "))", re.IGNORECASE)
+
+# Keywords that might indicate diagnosis (to flag/warn)
+DIAGNOSTIC_KEYWORDS = (
+    "you have", "you are diagnosed", "this is definitely",
+    "you suffer from", "you are experiencing", "treatment for",
+    "take this medication", "prescribe", "medical advice"
+)
+
+# Phrases that indicate a potential medical emergency
+EMERGENCY_KEYWORDS = (
+    "chest pain", "can't breathe", "suicide", "severe bleeding",
+    "unconscious", "stroke", "heart attack", "overdose",
+    "severe pain", "can't move", "seizure"
+)
+
+# Basic XSS markers (for web interface)
+DANGEROUS_PATTERNS = ("<script", "javascript:", "onerror=", "onload=")
+
+# Each keyword set is matched with one compiled scan instead of one per keyword
+DIAGNOSTIC_PATTERN = _compile_keywords(DIAGNOSTIC_KEYWORDS)
+EMERGENCY_PATTERN = _compile_keywords(EMERGENCY_KEYWORDS)
+DANGEROUS_PATTERN = _compile_keywords(DANGEROUS_PATTERNS)
+
+# Patient ID should be alphanumeric with hyphens/underscores
+PATIENT_ID_PATTERN = re.compile(r'^[a-zA-Z0-9_-]+$')
+
 class SafetyEthicsAgent:
     """
     Agent responsible for ensuring ethical and safe operation
@@ -18,12 +82,15 @@ class SafetyEthicsAgent:
     def __init__(self):
         self.name = "Safety & Ethics Agent"
         
-        # Keywords that might indicate diagnosis (to flag/warn)
-        self.diagnostic_keywords = [
-            "you have", "you are diagnosed", "this is definitely",
-            "you suffer from", "you are experiencing", "treatment for",
-            "take this medication", "prescribe", "medical advice"
-        ]
+        # Keyword sets and their compiled patterns are shared module constants
+        self.diagnostic_keywords = DIAGNOSTIC_KEYWORDS
+        self.emergency_keywords = EMERGENCY_KEYWORDS
+        self.dangerous_patterns = DANGEROUS_PATTERNS
+        
+        self._diagnostic_pattern = DIAGNOSTIC_PATTERN
+        self._emergency_pattern = EMERGENCY_PATTERN
+        self._dangerous_pattern = DANGEROUS_PATTERN
+        self._patient_id_pattern = PATIENT_ID_PATTERN
         
         # Standard disclaimer
         self.standard_disclaimer = (
@@ -55,7 +122,7 @@ class SafetyEthicsAgent:
         validated = self._ensure_explainability(validated)
         
         # Add privacy notice
-        validated["privacy_notice"] = self._get_privacy_notice()
+        validated["privacy_notice"] = PRIVACY_NOTICE
         
         return validated
     
@@ -63,31 +130,14 @@ class SafetyEthicsAgent:
         """Check for potentially diagnostic language"""
         flags = []
         
-        # Check various fields for diagnostic keywords
-        fields_to_check = []
-        
-        if "explanation" in output:
-            fields_to_check.append(("explanation", output["explanation"]))
-        
-        if "recommendations" in output:
-            for rec in output.get("recommendations", []):
-                if isinstance(rec, str):
-                    fields_to_check.append(("recommendation", rec))
-        
-        if "forgotten_insights" in output:
-            for insight in output.get("forgotten_insights", []):
-                if isinstance(insight, str):
-                    fields_to_check.append(("insight", insight))
-        
-        # Check each field
-        for field_name, text in fields_to_check:
-            if not isinstance(text, str):
+        # Check each text field for diagnostic keywords
+        for field_name, text in self._iter_text_fields(output):
+            found = self._find_keywords(self._diagnostic_pattern, text)
+            if not found:
                 continue
-                
-            text_lower = text.lower()
             
             for keyword in self.diagnostic_keywords:
-                if keyword in text_lower:
+                if keyword in found:
                     flags.append({
                         "field": field_name,
                         "issue": f"Potentially diagnostic language detected: '{keyword}'",
@@ -97,6 +147,25 @@ class SafetyEthicsAgent:
         
         return flags
     
+    def _iter_text_fields(self, output: Dict[str, Any]):
+        """Yield (field name, text) for each checkable text field of an output"""
+        explanation = output.get("explanation")
+        if isinstance(explanation, str):
+            yield "explanation", explanation
+        
+        for rec in output.get("recommendations") or ():
+            if isinstance(rec, str):
+                yield "recommendation", rec
+        
+        for insight in output.get("forgotten_insights") or ():
+            if isinstance(insight, str):
+                yield "insight", insight
+    
+    def _find_keywords(self, pattern: re.Pattern, text: str) -> Set[str]:
+        """Return the set of keywords from a compiled pattern found in text"""
+        # Only the matched keywords are lowercased, never the whole text
+        return {match.lower() for match in pattern.findall(text)}
+    
     def _ensure_explainability(self, output: Dict[str, Any]) -> Dict[str, Any]:
         """Ensure output includes explainable reasoning"""
         # Add source tracking if similar cases are present
@@ -119,13 +188,6 @@ class SafetyEthicsAgent:
         
         return output
     
-    def _get_privacy_notice(self) -> str:
-        """Get privacy notice"""
-        return (
-            "Your medical data is stored securely and isolated to your patient ID. "
-            "This system can be deployed locally for complete privacy control."
-        )
-    
     def sanitize_user_input(self, user_input: str) -> Dict[str, Any]:
         """Sanitize and validate user input"""
         # Remove potential injection attempts
@@ -147,15 +209,13 @@ class SafetyEthicsAgent:
                 "sanitized": None
             }
         
-        # Basic XSS prevention (for web interface)
-        dangerous_patterns = ['<script', 'javascript:', 'onerror=', 'onload=']
-        for pattern in dangerous_patterns:
-            if pattern.lower() in sanitized.lower():
-                return {
-                    "valid": False,
-                    "error": "Invalid characters detected in input",
-                    "sanitized": None
-                }
+        # Basic XSS prevention (for web interface); the first hit is enough
+        if self._dangerous_pattern.search(sanitized):
+            return {
+                "valid": False,
+                "error": "Invalid characters detected in input",
+                "sanitized": None
+            }
         
         return {
             "valid": True,
@@ -165,9 +225,6 @@ class SafetyEthicsAgent:
     
     def validate_patient_id(self, patient_id: str) -> Dict[str, Any]:
         """Validate patient ID format"""
-        # Patient ID should be alphanumeric with hyphens/underscores
-        pattern = r'^[a-zA-Z0-9_-]+$'
-        
         if not patient_id:
             return {
                 "valid": False,
@@ -180,7 +237,7 @@ class SafetyEthicsAgent:
                 "error": "Patient ID too long"
             }
         
-        if not re.match(pattern, patient_id):
+        if not self._patient_id_pattern.match(patient_id):
             return {
                 "valid": False,
                 "error": "Patient ID contains invalid characters"
@@ -193,18 +250,10 @@ class SafetyEthicsAgent:
     
     def check_emergency_indicators(self, text: str) -> Dict[str, Any]:
         """Check if text indicates a medical emergency"""
-        emergency_keywords = [
-            "chest pain", "can't breathe", "suicide", "severe bleeding",
-            "unconscious", "stroke", "heart attack", "overdose",
-            "severe pain", "can't move", "seizure"
-        ]
-        
-        text_lower = text.lower()
-        detected = []
+        found = self._find_keywords(self._emergency_pattern, text)
         
-        for keyword in emergency_keywords:
-            if keyword in text_lower:
-                detected.append(keyword)
+        # Report hits in keyword order
+        detected = [keyword for keyword in self.emergency_keywords if keyword in found]
         
         if detected:
             return {
@@ -223,35 +272,11 @@ class SafetyEthicsAgent:
     
     def generate_consent_notice(self) -> str:
         """Generate informed consent notice"""
-        return """
-INFORMED CONSENT & DISCLAIMER
-
-By using CareLedger, you acknowledge that:
-
-1. This system provides DECISION SUPPORT ONLY, not medical diagnosis or treatment
-2. All information should be reviewed with qualified healthcare providers
-3. This system does not replace professional medical advice
-4. In emergencies, contact emergency services immediately
-5. Your medical data is stored securely but you should maintain original records
-6. The AI may make errors - always verify important information with your doctor
-
-This system is designed to help you and your healthcare providers make better-informed 
-decisions by maintaining a comprehensive medical history, but it is not a substitute 
-for professional medical judgment.
-"""
+        return CONSENT_NOTICE
     
     def get_data_usage_policy(self) -> str:
         """Get data usage policy"""
-        return """
-DATA USAGE POLICY
-
-- Your medical records are isolated to your patient ID
-- No data is shared with third parties
-- Embeddings are derived from your records but cannot reconstruct original data
-- You can request deletion of all your data at any time
-- System can be deployed locally for complete privacy control
-- AI processing uses your data only for your own medical memory
-"""
+        return DATA_USAGE_POLICY
 
 # Global instance
 safety_agent = SafetyEthicsAgent()
@@ -3,11 +3,29 @@ Similarity Reasoning Agent
 Finds past medical states similar to current query
 Uses vector similarity and temporal reasoning
 """
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple, Union
+from functools import lru_cache
 from datetime import datetime, timedelta
-from utils.vector_store import qdrant_manager
-from utils.embeddings import embedding_manager
-from models.schemas import SimilarCase
+import heapq
+import logging
+import re
+import numpy as np
+from models.schemas import RecordType
+from utils.cache import unfollowed_index_cache
+
+logger = logging.getLogger(__name__)
+
+# Time decay halves a record's recency factor every year
+INVERSE_YEAR_DAYS = 1.0 / 365
+
+# Query classes that favour a record modality (case-insensitive substring match)
+SYMPTOM_QUERY_PATTERN = re.compile("symptom|treatment|medication|pain", re.IGNORECASE)
+IMAGE_QUERY_PATTERN = re.compile("scan|x-ray|image", re.IGNORECASE)
+
+@lru_cache(maxsize=128)
+def _symptom_pattern(symptoms: Tuple[str, ...]) -> re.Pattern:
+    """Compile symptoms into one case-insensitive pattern, cached per symptom set"""
+    return re.compile("|".join(map(re.escape, symptoms)), re.IGNORECASE)
 
 class SimilarityReasoningAgent:
     """
@@ -27,7 +45,8 @@ class SimilarityReasoningAgent:
         limit: int = 10,
         include_old_records: bool = True,
         time_weight: float = 0.3,  # Weight for recency (0-1)
-        modality_weight: bool = True  # Prefer text for symptom queries
+        modality_weight: bool = True,  # Prefer text for symptom queries
+        with_timeline: bool = False  # Also return the patient's timeline
     ) -> Dict[str, Any]:
         """
         Find similar past medical cases with INTELLIGENT WEIGHTING
@@ -35,63 +54,38 @@ class SimilarityReasoningAgent:
         Args:
             time_weight: How much to favor recent records (0=ignore time, 1=only time)
             modality_weight: Whether to weight by modality appropriateness
+            with_timeline: Fetch the timeline in the same Qdrant request
         """
+        # Imported on first use so loading this module stays cheap
+        from utils.vector_store import qdrant_manager
+        from utils.embeddings import embedding_manager
+        
         try:
-            # Generate query embedding
-            query_embedding = embedding_manager.embed_text(query)
+            # Generate query embedding (cached for repeated queries)
+            query_embedding = embedding_manager.embed_query(query)
             
             # Search for similar records
-            similar_records = qdrant_manager.search_similar(
+            search_args = dict(
                 query_embedding=query_embedding,
                 patient_id=patient_id,
                 modality="text",
                 limit=limit * 2,  # Get more candidates for re-ranking
                 score_threshold=0.3
             )
+            timeline = None
+            if with_timeline:
+                similar_records, timeline = qdrant_manager.search_similar_with_timeline(**search_args)
+            else:
+                similar_records = qdrant_manager.search_similar(**search_args)
+            retrieved_ids = [record["id"] for record in similar_records]
             
             # === INTELLIGENT RE-RANKING ===
             now = datetime.now()
-            re_ranked_records = []
-            
-            for record in similar_records:
-                payload = record["payload"]
-                base_similarity = record["score"]
-                
-                # TIME-WEIGHTED SIMILARITY
-                # Recent records get a boost, but not too much
-                record_date = datetime.fromisoformat(payload["date"])
-                days_old = (now - record_date).days
-                
-                if time_weight > 0:
-                    # Exponential decay: recent = 1.0, 1 year = 0.5, 2 years = 0.25
-                    time_factor = 0.5 ** (days_old / 365)
-                    time_boosted_similarity = (base_similarity * (1 - time_weight)) + (time_factor * time_weight)
-                else:
-                    time_boosted_similarity = base_similarity
-                
-                # MODALITY-WEIGHTED SIMILARITY
-                # Text records are better for symptom/treatment queries
-                modality = payload.get("modality", "text")
-                if modality_weight:
-                    if modality == "text" and any(word in query.lower() for word in ["symptom", "treatment", "medication", "pain"]):
-                        time_boosted_similarity *= 1.1  # 10% boost
-                    elif modality == "image" and any(word in query.lower() for word in ["scan", "x-ray", "image"]):
-                        time_boosted_similarity *= 1.1
-                
-                # MEMORY WEIGHT (from reinforcement/decay)
-                memory_weight = payload.get("memory_weight", 1.0)
-                final_score = time_boosted_similarity * memory_weight
-                
-                record["final_score"] = final_score
-                record["time_boosted_score"] = time_boosted_similarity
-                record["days_old"] = days_old
-                re_ranked_records.append(record)
-            
-            # Sort by final score
-            re_ranked_records.sort(key=lambda x: x["final_score"], reverse=True)
-            similar_records = re_ranked_records[:limit]
+            similar_records = self._rerank_records(
+                similar_records, query, now, time_weight, modality_weight, limit
+            )
             
-            print(f"[SIMILARITY] Re-ranked {len(similar_records)} records with time_weight={time_weight}")
+            logger.debug("[SIMILARITY] Re-ranked %d records with time_weight=%s", len(similar_records), time_weight)
             
             # Separate into recent and old cases
             recent_threshold = now - timedelta(days=180)  # 6 months
@@ -102,46 +96,55 @@ class SimilarityReasoningAgent:
             
             for record in similar_records:
                 payload = record["payload"]
-                record_date = datetime.fromisoformat(payload["date"])
-                
-                case = SimilarCase(
-                    record_id=payload["record_id"],
-                    record_type=payload["record_type"],
-                    content=payload["content"],
-                    date=record_date,
-                    similarity_score=record["final_score"],  # Use final weighted score
-                    relevance_explanation=self._generate_relevance_explanation(
-                        query, payload, record["final_score"], record.get("days_old", 0)
-                    ),
-                    metadata=payload.get("metadata", {})
-                )
+                record_date = record["_date"]
                 
                 if record_date >= recent_threshold:
-                    recent_cases.append(case)
+                    cases = recent_cases
                 elif record_date >= old_threshold:
-                    old_cases.append(case)
+                    cases = old_cases
+                else:
+                    continue
+                
+                # Built directly in SimilarCase's serialized shape
+                cases.append({
+                    "record_id": payload["record_id"],
+                    "record_type": RecordType(payload["record_type"]),
+                    "content": payload["content"],
+                    "date": record_date,
+                    "similarity_score": record["final_score"],  # Use final weighted score
+                    "relevance_explanation": self._generate_relevance_explanation(
+                        query, payload, record["final_score"], record.get("days_old", 0)
+                    ),
+                    "metadata": payload.get("metadata", {})
+                })
             
             # Identify forgotten insights from old records
             forgotten_insights = []
             if include_old_records and old_cases:
                 forgotten_insights = self._identify_forgotten_patterns(
-                    query, old_cases, recent_cases
+                    query, old_cases, recent_cases, now,
+                    unfollowed=self.get_unfollowed_index(patient_id)
                 )
             
-            return {
+            result = {
                 "success": True,
                 "query": query,
                 "total_found": len(similar_records),
-                "recent_cases": [case.dict() for case in recent_cases],
-                "old_cases": [case.dict() for case in old_cases],
+                "recent_cases": recent_cases,
+                "old_cases": old_cases,
                 "forgotten_insights": forgotten_insights,
                 "temporal_context": self._build_temporal_context(similar_records),
+                "retrieved_ids": retrieved_ids,  # Every record the search reinforced
                 "ranking_info": {
                     "time_weight_applied": time_weight,
                     "modality_weighted": modality_weight,
                     "memory_evolution_considered": True
                 }
             }
+            if with_timeline:
+                result["timeline"] = timeline
+            
+            return result
             
         except Exception as e:
             return {
@@ -149,6 +152,70 @@ class SimilarityReasoningAgent:
                 "error": str(e)
             }
     
+    def _rerank_records(
+        self,
+        similar_records: List[Dict[str, Any]],
+        query: str,
+        now: datetime,
+        time_weight: float,
+        modality_weight: bool,
+        limit: int
+    ) -> List[Dict[str, Any]]:
+        """
+        Re-rank search hits by recency, modality fit and memory weight
+        Scores are computed for all candidates at once as NumPy columns,
+        and only the top `limit` records are returned
+        """
+        base_similarity = np.array([record["score"] for record in similar_records], dtype=float)
+        record_dates = np.array(
+            [record["payload"]["date"] for record in similar_records],
+            dtype="datetime64[us]"
+        )
+        days_old = (np.datetime64(now, "us") - record_dates) // np.timedelta64(1, "D")
+        
+        # TIME-WEIGHTED SIMILARITY
+        # Recent records get a boost, but not too much
+        if time_weight > 0:
+            # Exponential decay: recent = 1.0, 1 year = 0.5, 2 years = 0.25
+            time_factor = np.exp2(days_old * -INVERSE_YEAR_DAYS)
+            time_boosted_similarity = (base_similarity * (1 - time_weight)) + (time_factor * time_weight)
+        else:
+            time_boosted_similarity = base_similarity
+        
+        # MODALITY-WEIGHTED SIMILARITY
+        # Text records are better for symptom/treatment queries
+        if modality_weight:
+            is_symptom_query = SYMPTOM_QUERY_PATTERN.search(query) is not None
+            is_image_query = IMAGE_QUERY_PATTERN.search(query) is not None
+            modalities = np.array(
+                [record["payload"].get("modality", "text") for record in similar_records],
+                dtype=object
+            )
+            boosted = ((modalities == "text") & is_symptom_query) | ((modalities == "image") & is_image_query)
+            time_boosted_similarity = np.where(boosted, time_boosted_similarity * 1.1, time_boosted_similarity)  # 10% boost
+        
+        # MEMORY WEIGHT (from reinforcement/decay)
+        memory_weight = np.array(
+            [record["payload"].get("memory_weight", 1.0) for record in similar_records],
+            dtype=float
+        )
+        final_score = time_boosted_similarity * memory_weight
+        scores = final_score.tolist()
+        
+        # Keep the parsed dates on each record so later steps never re-parse them
+        for record, record_date, final, boosted_score, days in zip(
+            similar_records, record_dates.tolist(), scores,
+            time_boosted_similarity.tolist(), days_old.tolist()
+        ):
+            record["_date"] = record_date
+            record["final_score"] = final
+            record["time_boosted_score"] = boosted_score
+            record["days_old"] = days
+        
+        # Select the top records by final score; ties keep search order
+        top = heapq.nlargest(limit, range(len(scores)), key=scores.__getitem__)
+        return [similar_records[i] for i in top]
+    
     def _generate_relevance_explanation(
         self,
         query: str,
@@ -188,36 +255,57 @@ class SimilarityReasoningAgent:
         
         return explanation
     
+    def get_unfollowed_index(self, patient_id: str) -> Dict[str, str]:
+        """
+        Record IDs with an unfollowed recommendation, per patient
+        Built once from a filtered Qdrant scroll and kept until the patient
+        ingests new records
+        """
+        from utils.vector_store import qdrant_manager
+        
+        index = unfollowed_index_cache.get(patient_id)
+        if index is None:
+            index = qdrant_manager.get_unfollowed_recommendations(patient_id)
+            unfollowed_index_cache.set(patient_id, index)
+        return index
+    
     def _identify_forgotten_patterns(
         self,
         query: str,
-        old_cases: List[SimilarCase],
-        recent_cases: List[SimilarCase]
+        old_cases: List[Dict[str, Any]],
+        recent_cases: List[Dict[str, Any]],
+        now: Optional[datetime] = None,
+        unfollowed: Optional[Dict[str, str]] = None
     ) -> List[str]:
         """
         Identify patterns in old records that might be FORGOTTEN
         This is the "WOW moment" feature
+        
+        Args:
+            unfollowed: Precomputed record ID -> unfollowed recommendation index;
+                without it each old case's metadata is checked
         """
         insights = []
+        now = now or datetime.now()
         
         # === EXPLICIT FORGOTTEN INSIGHT DETECTION ===
-        print(f"\n{'='*70}")
-        print(f"💡 FORGOTTEN INSIGHT DETECTION")
-        print(f"{'='*70}")
-        print(f"Analyzing {len(old_cases)} old records (>6 months) vs {len(recent_cases)} recent records")
-        print(f"{'='*70}\n")
+        debug = logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            logger.debug("=" * 70)
+            logger.debug("💡 FORGOTTEN INSIGHT DETECTION")
+            logger.debug(
+                "Analyzing %d old records (>6 months) vs %d recent records",
+                len(old_cases), len(recent_cases)
+            )
+            logger.debug("=" * 70)
         
         # Check for patterns that appeared before but not recently
-        old_symptoms = set()
-        recent_symptoms = set()
-        
-        for case in old_cases:
-            if case.metadata.get("symptoms"):
-                old_symptoms.update(case.metadata["symptoms"])
-        
-        for case in recent_cases:
-            if case.metadata.get("symptoms"):
-                recent_symptoms.update(case.metadata["symptoms"])
+        old_symptoms = frozenset().union(
+            *(case["metadata"].get("symptoms") or () for case in old_cases)
+        )
+        recent_symptoms = frozenset().union(
+            *(case["metadata"].get("symptoms") or () for case in recent_cases)
+        )
         
         # Find symptoms that appeared before but not recently
         forgotten_symptoms = old_symptoms - recent_symptoms
@@ -229,39 +317,46 @@ class SimilarityReasoningAgent:
                 f"This historical context may be important for your current situation."
             )
             insights.append(insight)
-            print(f"✅ Found forgotten symptom pattern: {forgotten_symptoms}")
+            if debug:
+                logger.debug("✅ Found forgotten symptom pattern: %s", set(forgotten_symptoms))
         
         # === CHECK FOR UNFOLLOWED RECOMMENDATIONS (Critical!) ===
-        for case in old_cases:
-            if case.similarity_score > 0.6:  # Only for relevant old records
-                unfollowed = case.metadata.get("unfollowed_recommendation")
-                if unfollowed:
-                    age_months = (datetime.now() - case.date).days // 30
+        # The index answers by record ID, and patients without any skip the loop
+        if unfollowed is None:
+            unfollowed = {
+                case["record_id"]: case["metadata"].get("unfollowed_recommendation")
+                for case in old_cases
+            }
+        for case in old_cases if unfollowed else ():
+            if case["similarity_score"] > 0.6:  # Only for relevant old records
+                recommendation = unfollowed.get(case["record_id"])
+                if recommendation:
+                    age_months = (now - case["date"]).days // 30
                     insight = (
                         f"⚠️ UNFOLLOWED RECOMMENDATION: {age_months} months ago, during a similar episode, "
-                        f"your doctor recommended '{unfollowed}' but this was never followed up on. "
+                        f"your doctor recommended '{recommendation}' but this was never followed up on. "
                         f"This may be worth discussing with your healthcare provider."
                     )
                     insights.append(insight)
-                    print(f"✅ Found unfollowed recommendation from {age_months} months ago")
-                    print(f"   → {unfollowed}")
+                    if debug:
+                        logger.debug("✅ Found unfollowed recommendation from %d months ago: %s", age_months, recommendation)
         
         # Check for old records with high similarity but no recent follow-up
-        highly_similar_old = [c for c in old_cases if c.similarity_score > 0.7]
-        if highly_similar_old and len(recent_cases) < 2:
-            oldest = highly_similar_old[0]
-            months_ago = (datetime.now() - oldest.date).days // 30
+        oldest = next((c for c in old_cases if c["similarity_score"] > 0.7), None)
+        if oldest is not None and len(recent_cases) < 2:
+            months_ago = (now - oldest["date"]).days // 30
             insight = (
-                f"📅 HISTORICAL MATCH: A very similar situation ({oldest.record_type}) was documented "
-                f"{months_ago} months ago ({oldest.date.strftime('%B %Y')}), but there's no recent follow-up "
+                f"📅 HISTORICAL MATCH: A very similar situation ({oldest['record_type']}) was documented "
+                f"{months_ago} months ago ({oldest['date'].strftime('%B %Y')}), but there's no recent follow-up "
                 f"on record. The previous episode may provide valuable context."
             )
             insights.append(insight)
-            print(f"✅ Found high-similarity historical match from {months_ago} months ago")
+            if debug:
+                logger.debug("✅ Found high-similarity historical match from %d months ago", months_ago)
         
         # Check for recurring patterns (seasonal or cyclic)
         if len(old_cases) >= 3:
-            dates = [c.date for c in old_cases]
+            dates = [c["date"] for c in old_cases]
             dates.sort()
             
             # Check if there's a seasonal pattern (same months)
@@ -274,14 +369,14 @@ class SimilarityReasoningAgent:
                     f"This suggests a potential seasonal or cyclical pattern worth monitoring."
                 )
                 insights.append(insight)
-                print(f"✅ Found recurring seasonal pattern: {set(months)}")
+                if debug:
+                    logger.debug("✅ Found recurring seasonal pattern: %s", set(months))
         
-        if insights:
-            print(f"\n{'='*70}")
-            print(f"🎯 TOTAL FORGOTTEN INSIGHTS: {len(insights)}")
-            print(f"{'='*70}\n")
-        else:
-            print(f"ℹ️ No significant forgotten insights detected\n")
+        if debug:
+            if insights:
+                logger.debug("🎯 TOTAL FORGOTTEN INSIGHTS: %d", len(insights))
+            else:
+                logger.debug("ℹ️ No significant forgotten insights detected")
         
         return insights[:3]  # Return max 3 insights
     
@@ -293,30 +388,28 @@ class SimilarityReasoningAgent:
         if not similar_records:
             return []
         
-        # Sort by date
-        sorted_records = sorted(
-            similar_records,
-            key=lambda x: datetime.fromisoformat(x["payload"]["date"])
-        )
+        # Sort by date (parsed once during re-ranking)
+        sorted_records = sorted(similar_records, key=lambda x: x["_date"])
         
         context = []
-        for i, record in enumerate(sorted_records):
+        prev_date = None
+        for record in sorted_records:
             payload = record["payload"]
-            date = datetime.fromisoformat(payload["date"])
+            date = record["_date"]
+            content = payload.get("content") or ""
             
             # Calculate time since previous similar case
             time_since_previous = None
-            if i > 0:
-                prev_date = datetime.fromisoformat(sorted_records[i-1]["payload"]["date"])
-                days_diff = (date - prev_date).days
-                time_since_previous = f"{days_diff} days"
+            if prev_date is not None:
+                time_since_previous = f"{(date - prev_date).days} days"
+            prev_date = date
             
             context.append({
                 "date": date.isoformat(),
                 "record_type": payload.get("record_type"),
                 "similarity": record["score"],
                 "time_since_previous": time_since_previous,
-                "content_preview": payload.get("content", "")[:100]
+                "content_preview": content[:100]
             })
         
         return context
@@ -324,10 +417,15 @@ class SimilarityReasoningAgent:
     def analyze_symptom_progression(
         self,
         patient_id: str,
-        symptom: str,
+        symptom: Union[str, List[str]],
         time_window_days: int = 365
     ) -> Dict[str, Any]:
-        """Analyze how a specific symptom has progressed over time"""
+        """
+        Analyze how a specific symptom has progressed over time
+        A list of symptoms matches records mentioning any of them
+        """
+        from utils.vector_store import qdrant_manager
+        
         try:
             # Get timeline
             end_date = datetime.now()
@@ -339,11 +437,12 @@ class SimilarityReasoningAgent:
                 end_date=end_date
             )
             
-            # Filter for records mentioning the symptom
-            symptom_lower = symptom.lower()
+            # Filter for records mentioning the symptom(s) in one scan per record
+            symptoms = [symptom] if isinstance(symptom, str) else symptom
+            pattern = _symptom_pattern(tuple(sorted({s.lower() for s in symptoms})))
             related_records = [
                 record for record in timeline
-                if symptom_lower in record["payload"].get("content", "").lower()
+                if pattern.search(record["payload"].get("content", ""))
             ]
             
             if not related_records:
@@ -354,14 +453,18 @@ class SimilarityReasoningAgent:
                     "message": "No records found for this symptom in the specified time window"
                 }
             
-            # Analyze progression
+            # Analyze progression, parsing and sorting all dates in one go
             occurrences = len(related_records)
-            dates = [datetime.fromisoformat(r["payload"]["date"]) for r in related_records]
-            dates.sort()
+            dates = np.array(
+                [r["payload"]["date"] for r in related_records],
+                dtype="datetime64[us]"
+            )
+            order = np.argsort(dates, kind="stable")
+            dates = dates[order]
             
             # Calculate frequency
             if len(dates) > 1:
-                total_span = (dates[-1] - dates[0]).days
+                total_span = int((dates[-1] - dates[0]) // np.timedelta64(1, "D"))
                 avg_frequency = total_span / len(dates) if total_span > 0 else 0
             else:
                 avg_frequency = 0
@@ -370,8 +473,8 @@ class SimilarityReasoningAgent:
                 "success": True,
                 "symptom": symptom,
                 "occurrences": occurrences,
-                "first_occurrence": dates[0].isoformat(),
-                "latest_occurrence": dates[-1].isoformat(),
+                "first_occurrence": dates[0].item().isoformat(),
+                "latest_occurrence": dates[-1].item().isoformat(),
                 "average_frequency_days": round(avg_frequency, 1),
                 "trend": "recurring" if occurrences >= 3 else "isolated",
                 "timeline": [
@@ -379,7 +482,7 @@ class SimilarityReasoningAgent:
                         "date": d.isoformat(),
                         "record_type": related_records[i]["payload"].get("record_type")
                     }
-                    for i, d in enumerate(dates)
+                    for i, d in zip(order.tolist(), dates.tolist())
                 ]
             }
             
@@ -5,22 +5,36 @@ Provides REST API for all CareLedger operations
 from fastapi import FastAPI, HTTPException, UploadFile, File, Form
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
-from pydantic import BaseModel
-from typing import Optional, List
+from pydantic import BaseModel, TypeAdapter, ValidationError
+from typing import Optional, List, Dict, Callable, Any
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, lru_cache
+import asyncio
+import time
+import orjson
+import uvicorn
 import shutil
 import os
 from datetime import datetime
 
+from config import settings
+from utils.cache import timeline_cache, memory_summary_cache
 from orchestrator import orchestrator
 from models.schemas import (
-    PatientQuery, IngestionRequest, RecordType, Modality
+    PatientQuery, IngestionRequest, RecordType, Modality, ORJSON_OPTIONS
 )
 
+class ORJSONResponse(JSONResponse):
+    """JSON response rendered with orjson"""
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=ORJSON_OPTIONS)
+
 # Initialize FastAPI app
 app = FastAPI(
     title="CareLedger API",
     description="AI-powered lifelong medical memory system",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 # Add CORS middleware
@@ -32,6 +46,41 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Bounded pool for blocking orchestrator calls, keeps the event loop free
+executor = ThreadPoolExecutor(
+    max_workers=settings.API_WORKER_THREADS,
+    thread_name_prefix="careledger-api"
+)
+
+async def run_blocking(func: Callable, *args, **kwargs) -> Any:
+    """Run a blocking call in the worker pool without stalling the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, partial(func, *args, **kwargs))
+
+# Record type lookup by value
+RECORD_TYPES = {t.value: t for t in RecordType}
+RECORD_TYPE_VALUES = list(RECORD_TYPES)
+
+# Uploaded files are stored here before ingestion
+UPLOAD_DIR = "data/uploads"
+
+# Supported upload file types
+PDF_EXTENSION = ".pdf"
+IMAGE_EXTENSIONS = frozenset({".jpg", ".jpeg", ".png", ".gif", ".bmp"})
+
+# Parses form metadata straight from JSON in a single validation pass
+metadata_adapter = TypeAdapter(Dict[str, Any])
+
+def save_upload(file: UploadFile, file_path: str, chunk_size: int = 1 << 20):
+    """Stream an uploaded file to disk in fixed-size chunks"""
+    with open(file_path, "wb") as buffer:
+        shutil.copyfileobj(file.file, buffer, chunk_size)
+
+def invalidate_patient_cache(patient_id: str):
+    """Drop cached timeline and summary responses after a patient's records change"""
+    timeline_cache.delete(patient_id)
+    memory_summary_cache.delete(patient_id)
+
 # Request/Response Models
 class QueryRequest(BaseModel):
     patient_id: str
@@ -42,7 +91,7 @@ class IngestTextRequest(BaseModel):
     patient_id: str
     record_type: str
     content: str
-    metadata: Optional[dict] = {}
+    metadata: Optional[Dict[str, Any]] = None
 
 class SymptomAnalysisRequest(BaseModel):
     patient_id: str
@@ -53,9 +102,16 @@ class SymptomAnalysisRequest(BaseModel):
 @app.on_event("startup")
 async def startup_event():
     """Initialize CareLedger on startup"""
-    orchestrator.initialize()
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    await run_blocking(orchestrator.initialize)
     print("CareLedger API started successfully!")
 
+# Shutdown event
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Release the worker pool on shutdown"""
+    executor.shutdown(wait=False)
+
 # Health check endpoint
 @app.get("/")
 async def root():
@@ -66,12 +122,17 @@ async def root():
         "status": "healthy"
     }
 
+@lru_cache(maxsize=1)
+def iso_timestamp(second: int) -> str:
+    """Format a Unix second as ISO 8601, memoized for repeated health checks"""
+    return datetime.fromtimestamp(second).isoformat()
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
     return {
         "status": "healthy",
-        "timestamp": datetime.now().isoformat()
+        "timestamp": iso_timestamp(int(time.time()))
     }
 
 # Query endpoint
@@ -82,20 +143,21 @@ async def query_medical_history(request: QueryRequest):
     Returns similar cases, recommendations, and insights
     """
     try:
-        # Create query object
-        query = PatientQuery(
+        # Create query object (fields already validated by QueryRequest)
+        query = PatientQuery.model_construct(
             patient_id=request.patient_id,
             query_text=request.query_text,
             current_symptoms=request.current_symptoms
         )
         
         # Process query through orchestrator
-        result = orchestrator.process_query(query)
+        result = await orchestrator.aprocess_query(query, executor)
         
-        return {
+        # orjson encodes the plain dump directly, so skip FastAPI's jsonable_encoder pass
+        return ORJSONResponse({
             "success": True,
-            "result": result.dict()
-        }
+            "result": result.model_dump()
+        })
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -106,29 +168,29 @@ async def ingest_text_record(request: IngestTextRequest):
     """Ingest a text-based medical record"""
     try:
         # Validate record type
-        try:
-            record_type = RecordType(request.record_type)
-        except ValueError:
+        record_type = RECORD_TYPES.get(request.record_type)
+        if record_type is None:
             raise HTTPException(
                 status_code=400,
-                detail=f"Invalid record type. Must be one of: {[t.value for t in RecordType]}"
+                detail=f"Invalid record type. Must be one of: {RECORD_TYPE_VALUES}"
             )
         
-        # Create ingestion request
-        ingestion_request = IngestionRequest(
+        # Add date if not provided
+        metadata = request.metadata or {}
+        metadata.setdefault("date", datetime.now().isoformat())
+        
+        # Create ingestion request (fields already validated by IngestTextRequest)
+        ingestion_request = IngestionRequest.model_construct(
             patient_id=request.patient_id,
             record_type=record_type,
             modality=Modality.TEXT,
             content=request.content,
-            metadata=request.metadata or {}
+            metadata=metadata
         )
         
-        # Add date if not provided
-        if "date" not in ingestion_request.metadata:
-            ingestion_request.metadata["date"] = datetime.now()
-        
         # Ingest through orchestrator
-        result = orchestrator.ingest_record(ingestion_request)
+        result = await run_blocking(orchestrator.ingest_record, ingestion_request)
+        invalidate_patient_cache(ingestion_request.patient_id)
         
         return result
         
@@ -148,28 +210,23 @@ async def ingest_file(
     """Ingest a file-based medical record (PDF or image)"""
     try:
         # Validate record type
-        try:
-            record_type_enum = RecordType(record_type)
-        except ValueError:
+        record_type_enum = RECORD_TYPES.get(record_type)
+        if record_type_enum is None:
             raise HTTPException(
                 status_code=400,
-                detail=f"Invalid record type. Must be one of: {[t.value for t in RecordType]}"
+                detail=f"Invalid record type. Must be one of: {RECORD_TYPE_VALUES}"
             )
         
         # Save uploaded file
-        upload_dir = "data/uploads"
-        os.makedirs(upload_dir, exist_ok=True)
+        file_path = os.path.join(UPLOAD_DIR, f"{patient_id}_{time.time_ns()}_{file.filename}")
         
-        file_path = os.path.join(upload_dir, f"{patient_id}_{datetime.now().timestamp()}_{file.filename}")
-        
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        await run_blocking(save_upload, file, file_path)
         
         # Determine modality
-        file_extension = file.filename.lower().split(".")[-1]
-        if file_extension == "pdf":
+        file_extension = os.path.splitext(file.filename)[1].lower()
+        if file_extension == PDF_EXTENSION:
             modality = Modality.TEXT
-        elif file_extension in ["jpg", "jpeg", "png", "gif", "bmp"]:
+        elif file_extension in IMAGE_EXTENSIONS:
             modality = Modality.IMAGE
         else:
             raise HTTPException(
@@ -178,14 +235,16 @@ async def ingest_file(
             )
         
         # Parse metadata
-        import json
         try:
-            metadata_dict = json.loads(metadata)
-        except:
+            metadata_dict = metadata_adapter.validate_json(metadata)
+        except ValidationError:
             metadata_dict = {}
         
-        # Create ingestion request
-        ingestion_request = IngestionRequest(
+        # Add date if not provided
+        metadata_dict.setdefault("date", datetime.now().isoformat())
+        
+        # Create ingestion request (fields already validated above)
+        ingestion_request = IngestionRequest.model_construct(
             patient_id=patient_id,
             record_type=record_type_enum,
             modality=modality,
@@ -193,12 +252,9 @@ async def ingest_file(
             metadata=metadata_dict
         )
         
-        # Add date if not provided
-        if "date" not in ingestion_request.metadata:
-            ingestion_request.metadata["date"] = datetime.now()
-        
         # Ingest through orchestrator
-        result = orchestrator.ingest_record(ingestion_request)
+        result = await run_blocking(orchestrator.ingest_record, ingestion_request)
+        invalidate_patient_cache(ingestion_request.patient_id)
         
         return result
         
@@ -212,11 +268,15 @@ async def ingest_file(
 async def get_patient_timeline(patient_id: str):
     """Get patient's complete medical timeline"""
     try:
-        timeline = orchestrator.get_patient_timeline(patient_id)
-        return {
-            "success": True,
-            "timeline": timeline.dict()
-        }
+        response = timeline_cache.get(patient_id)
+        if response is None:
+            timeline = await run_blocking(orchestrator.get_patient_timeline, patient_id)
+            response = {
+                "success": True,
+                "timeline": timeline.model_dump()
+            }
+            timeline_cache.set(patient_id, response)
+        return ORJSONResponse(response)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -225,11 +285,15 @@ async def get_patient_timeline(patient_id: str):
 async def get_memory_summary(patient_id: str):
     """Get patient's memory summary and health"""
     try:
-        summary = orchestrator.get_memory_summary(patient_id)
-        return {
-            "success": True,
-            "summary": summary
-        }
+        response = memory_summary_cache.get(patient_id)
+        if response is None:
+            summary = await run_blocking(orchestrator.get_memory_summary, patient_id)
+            response = {
+                "success": True,
+                "summary": summary
+            }
+            memory_summary_cache.set(patient_id, response)
+        return ORJSONResponse(response)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -238,7 +302,8 @@ async def get_memory_summary(patient_id: str):
 async def analyze_symptom(patient_id: str, request: SymptomAnalysisRequest):
     """Analyze how a symptom has progressed over time"""
     try:
-        result = orchestrator.analyze_symptom_progression(
+        result = await run_blocking(
+            orchestrator.analyze_symptom_progression,
             patient_id=request.patient_id,
             symptom=request.symptom,
             time_window_days=request.time_window_days
@@ -252,7 +317,8 @@ async def analyze_symptom(patient_id: str, request: SymptomAnalysisRequest):
 async def apply_maintenance(patient_id: str):
     """Apply memory maintenance (temporal decay, etc.)"""
     try:
-        result = orchestrator.apply_memory_maintenance(patient_id)
+        result = await run_blocking(orchestrator.apply_memory_maintenance, patient_id)
+        invalidate_patient_cache(patient_id)
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -261,6 +327,11 @@ async def apply_maintenance(patient_id: str):
 @app.get("/consent")
 async def get_consent():
     """Get informed consent notice"""
+    return consent_response()
+
+@lru_cache(maxsize=1)
+def consent_response() -> Dict[str, str]:
+    """Build the static consent response once"""
     return {
         "consent_notice": orchestrator.get_consent_notice()
     }
@@ -269,10 +340,26 @@ async def get_consent():
 @app.get("/data-policy")
 async def get_data_policy():
     """Get data usage policy"""
+    return data_policy_response()
+
+@lru_cache(maxsize=1)
+def data_policy_response() -> Dict[str, str]:
+    """Build the static data policy response once"""
     return {
         "data_policy": orchestrator.get_data_usage_policy()
     }
 
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # Each worker is a separate process: an in-memory Qdrant store would not
+    # be shared, and the response caches are invalidated only in the worker
+    # that handled an ingest, so extra workers are opt-in (API_WORKERS)
+    workers = 1 if settings.QDRANT_IN_MEMORY else settings.API_WORKERS
+    uvicorn.run(
+        "api:app",
+        host="0.0.0.0",
+        port=8000,
+        workers=workers,
+        loop="auto",  # uvloop/httptools when installed (uvicorn[standard]), else asyncio/h11
+        http="auto",
+        log_level="info"
+    )
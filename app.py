@@ -24,221 +24,26 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# ============================================================================
+# ORCHESTRATOR
+# ============================================================================
+@st.cache_resource
+def get_orchestrator():
+    """Initialize the orchestrator once and share it across reruns"""
+    orchestrator.initialize()
+    return orchestrator
+
 # ============================================================================
 # GLASSMORPHISM + PASTEL UI THEME (Medical Edition)
 # ============================================================================
-st.markdown("""
-<style>
-    @import url('https://fonts.googleapis.com/css2?family=Inter:wght@300;400;600;700;800&display=swap');
-    
-    * {
-        font-family: 'Inter', sans-serif;
-    }
-    
-    /* Pastel gradient background - Medical theme */
-    .main {
-        background: linear-gradient(135deg, #f0f4f8 0%, #d9e7ec 100%);
-    }
-    
-    /* Glassmorphism sidebar */
-    [data-testid="stSidebar"] {
-        background: rgba(216, 235, 243, 0.7);
-        backdrop-filter: blur(10px);
-        border-right: 1px solid rgba(255, 255, 255, 0.3);
-    }
-    
-    /* Headers with gradient - Medical colors */
-    h1, h2, h3, h4, h5, h6 {
-        color: #2C5F7C !important;
-        font-weight: 700;
-    }
-    
-    h1 {
-        background: linear-gradient(135deg, #2C5F7C 0%, #4A90A4 100%);
-        -webkit-background-clip: text;
-        -webkit-text-fill-color: transparent;
-    }
-    
-    /* Glassmorphism cards */
-    .glass-card {
-        background: rgba(255, 255, 255, 0.6);
-        backdrop-filter: blur(15px);
-        border-radius: 20px;
-        padding: 2rem;
-        box-shadow: 0 8px 32px rgba(0, 0, 0, 0.1);
-        border: 1px solid rgba(255, 255, 255, 0.4);
-        transition: all 0.3s ease;
-        animation: fadeIn 0.6s ease-out;
-    }
-    
-    .glass-card:hover {
-        transform: translateY(-5px);
-        box-shadow: 0 12px 40px rgba(0, 0, 0, 0.15);
-    }
-    
-    @keyframes fadeIn {
-        from { opacity: 0; transform: translateY(20px); }
-        to { opacity: 1; transform: translateY(0); }
-    }
-    
-    /* Hero section */
-    .hero-section {
-        background: linear-gradient(135deg, rgba(163, 211, 223, 0.6), rgba(139, 198, 214, 0.6));
-        backdrop-filter: blur(20px);
-        border-radius: 25px;
-        padding: 3rem;
-        text-align: center;
-        box-shadow: 0 8px 32px rgba(0, 0, 0, 0.1);
-        border: 1px solid rgba(255, 255, 255, 0.3);
-        margin-bottom: 2rem;
-        animation: heroFadeIn 1s ease-out;
-    }
-    
-    @keyframes heroFadeIn {
-        from { opacity: 0; transform: scale(0.95); }
-        to { opacity: 1; transform: scale(1); }
-    }
-    
-    .hero-logo {
-        font-size: 4rem;
-        animation: bounce 2s infinite;
-    }
-    
-    @keyframes bounce {
-        0%, 100% { transform: translateY(0); }
-        50% { transform: translateY(-10px); }
-    }
-    
-    .hero-title {
-        color: white !important;
-        font-size: 3.5rem;
-        font-weight: 900;
-        margin: 1rem 0;
-        text-shadow: 2px 2px 4px rgba(0, 0, 0, 0.2);
-    }
-    
-    .hero-subtitle {
-        color: white;
-        font-size: 1.5rem;
-        font-weight: 400;
-        opacity: 0.95;
-    }
-    
-    /* Buttons */
-    .stButton>button {
-        background: linear-gradient(135deg, #6BB6C8 0%, #7FC8D9 100%);
-        color: white;
-        border-radius: 15px;
-        height: 3.5em;
-        width: 100%;
-        font-size: 1.1em;
-        font-weight: 700;
-        border: none;
-        box-shadow: 0 4px 15px rgba(107, 182, 200, 0.4);
-        transition: all 0.3s ease;
-        text-transform: uppercase;
-        letter-spacing: 1px;
-    }
-    
-    .stButton>button:hover {
-        background: linear-gradient(135deg, #5AA5B7 0%, #6DB8CA 100%);
-        transform: translateY(-3px);
-        box-shadow: 0 6px 20px rgba(107, 182, 200, 0.5);
-    }
-    
-    /* Metric cards */
-    .metric-glass-card {
-        background: linear-gradient(135deg, rgba(107, 182, 200, 0.7), rgba(139, 198, 214, 0.7));
-        backdrop-filter: blur(15px);
-        padding: 1.8rem;
-        border-radius: 20px;
-        color: white;
-        text-align: center;
-        box-shadow: 0 8px 32px rgba(0, 0, 0, 0.1);
-        border: 1px solid rgba(255, 255, 255, 0.3);
-        transition: all 0.3s ease;
-    }
-    
-    .metric-glass-card:hover {
-        transform: translateY(-8px) scale(1.03);
-        box-shadow: 0 12px 40px rgba(107, 182, 200, 0.4);
-    }
-    
-    .metric-value {
-        font-size: 3rem;
-        font-weight: 900;
-        margin: 0.5rem 0;
-    }
-    
-    .metric-label {
-        font-size: 1.1rem;
-        opacity: 0.95;
-        font-weight: 500;
-        text-transform: uppercase;
-        letter-spacing: 1px;
-    }
-    
-    /* Alert boxes */
-    .glass-alert-success {
-        background: rgba(139, 215, 152, 0.6);
-        backdrop-filter: blur(10px);
-        padding: 1.5rem;
-        border-radius: 15px;
-        border-left: 5px solid #4CAF50;
-        margin: 1rem 0;
-        box-shadow: 0 4px 16px rgba(0, 0, 0, 0.1);
-    }
-    
-    .glass-alert-warning {
-        background: rgba(255, 224, 130, 0.6);
-        backdrop-filter: blur(10px);
-        padding: 1.5rem;
-        border-radius: 15px;
-        border-left: 5px solid #FF9800;
-        margin: 1rem 0;
-        box-shadow: 0 4px 16px rgba(0, 0, 0, 0.1);
-    }
-    
-    .glass-alert-info {
-        background: rgba(144, 202, 249, 0.6);
-        backdrop-filter: blur(10px);
-        padding: 1.5rem;
-        border-radius: 15px;
-        border-left: 5px solid #2196F3;
-        margin: 1rem 0;
-        box-shadow: 0 4px 16px rgba(0, 0, 0, 0.1);
-    }
-    
-    /* Tech badges */
-    .tech-badge {
-        display: inline-block;
-        background: rgba(255, 255, 255, 0.6);
-        backdrop-filter: blur(5px);
-        padding: 0.5rem 1rem;
-        margin: 0.3rem;
-        border-radius: 20px;
-        font-size: 0.9rem;
-        font-weight: 600;
-        color: #2C5F7C;
-        box-shadow: 0 2px 8px rgba(0, 0, 0, 0.1);
-    }
-    
-    /* Footer */
-    .footer {
-        background: linear-gradient(135deg, rgba(216, 235, 243, 0.6), rgba(192, 222, 234, 0.6));
-        backdrop-filter: blur(15px);
-        padding: 3rem 2rem;
-        border-radius: 20px;
-        text-align: center;
-        margin-top: 3rem;
-        box-shadow: 0 8px 32px rgba(0, 0, 0, 0.1);
-    }
-    
-    /* Hide Streamlit branding */
-    #MainMenu {visibility: hidden;}
-    footer {visibility: hidden;}
-</style>
-""", unsafe_allow_html=True)
+@st.cache_data
+def load_css() -> str:
+    """Read the theme stylesheet once and reuse it across reruns"""
+    css_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "careledger.css")
+    with open(css_path, encoding="utf-8") as css_file:
+        return f"<style>\n{css_file.read()}</style>"
+
+st.markdown(load_css(), unsafe_allow_html=True)
 
 # ============================================================================
 # HERO SECTION
@@ -321,66 +126,48 @@ with tab1:
             if query_text:
                 with st.spinner("🧠 AI agents analyzing your medical history..."):
                     try:
-                        orchestrator.initialize()
+                        careledger = get_orchestrator()
                         query = PatientQuery(
                             patient_id=demo_patient,
                             query_text=query_text
                         )
-                        result = orchestrator.process_query(query)
+                        result = careledger.process_query(query)
+                        
+                        # Build all result sections and render them in one write
+                        parts = []
                         
                         # Similar Cases
                         if result.similar_cases:
-                            st.markdown("""
-                            <div class="glass-card">
-                                <h4>📋 Similar Past Cases</h4>
-                            </div>
-                            """, unsafe_allow_html=True)
-                            
-                            for i, case in enumerate(result.similar_cases[:3], 1):
-                                st.markdown(f"""
-                                <div class="glass-alert-info">
-                                    <strong>Case {i} - {case.date.strftime('%B %d, %Y')}</strong>
-                                    <p style="margin-top: 0.5rem;">{case.content[:200]}...</p>
-                                    <small>Similarity: {case.similarity_score:.0%}</small>
-                                </div>
-                                """, unsafe_allow_html=True)
+                            parts.append('<div class="glass-card"><h4>📋 Similar Past Cases</h4></div>')
+                            parts.extend(
+                                f'<div class="glass-alert-info">'
+                                f'<strong>Case {i} - {case.date:%B %d, %Y}</strong>'
+                                f'<p style="margin-top: 0.5rem;">{case.content[:200]}...</p>'
+                                f'<small>Similarity: {case.similarity_score:.0%}</small>'
+                                f'</div>'
+                                for i, case in enumerate(result.similar_cases[:3], 1)
+                            )
                         
                         # Forgotten Insights (WOW MOMENT)
                         if result.forgotten_insights:
-                            st.markdown("""
-                            <div class="glass-card">
-                                <h4>💡 Forgotten Insights</h4>
-                            </div>
-                            """, unsafe_allow_html=True)
-                            
-                            for insight in result.forgotten_insights:
-                                st.markdown(f"""
-                                <div class="glass-alert-warning">
-                                    {insight}
-                                </div>
-                                """, unsafe_allow_html=True)
+                            parts.append('<div class="glass-card"><h4>💡 Forgotten Insights</h4></div>')
+                            parts.extend(
+                                f'<div class="glass-alert-warning">\n{insight}\n</div>'
+                                for insight in result.forgotten_insights
+                            )
                         
                         # Recommendations
                         if result.recommendations:
-                            st.markdown("""
-                            <div class="glass-card">
-                                <h4>📌 Recommendations</h4>
-                            </div>
-                            """, unsafe_allow_html=True)
-                            
-                            for rec in result.recommendations:
-                                st.markdown(f"""
-                                <div class="glass-alert-success">
-                                    {rec}
-                                </div>
-                                """, unsafe_allow_html=True)
+                            parts.append('<div class="glass-card"><h4>📌 Recommendations</h4></div>')
+                            parts.extend(
+                                f'<div class="glass-alert-success">\n{rec}\n</div>'
+                                for rec in result.recommendations
+                            )
                         
                         # Disclaimer
-                        st.markdown(f"""
-                        <div class="glass-alert-info">
-                            {result.safety_disclaimer}
-                        </div>
-                        """, unsafe_allow_html=True)
+                        parts.append(f'<div class="glass-alert-info">\n{result.safety_disclaimer}\n</div>')
+                        
+                        st.markdown("\n".join(parts), unsafe_allow_html=True)
                         
                     except Exception as e:
                         st.error(f"❌ Error: {str(e)}")
@@ -428,17 +215,16 @@ with tab3:
     if st.button("📅 Load Timeline"):
         with st.spinner("Loading timeline..."):
             try:
-                orchestrator.initialize()
-                timeline = orchestrator.get_patient_timeline(demo_patient)
+                timeline = get_orchestrator().get_patient_timeline(demo_patient)
                 
                 if timeline.events:
-                    for event in timeline.events:
-                        st.markdown(f"""
-                        <div class="glass-alert-info">
-                            <strong>{event.date.strftime('%B %d, %Y')} - {event.record_type.upper()}</strong>
-                            <p style="margin-top: 0.5rem;">{event.content[:150]}...</p>
-                        </div>
-                        """, unsafe_allow_html=True)
+                    st.markdown("".join(
+                        f'<div class="glass-alert-info">'
+                        f'<strong>{event.date:%B %d, %Y} - {event.event_type.upper()}</strong>'
+                        f'<p style="margin-top: 0.5rem;">{event.description[:150]}...</p>'
+                        f'</div>'
+                        for event in timeline.events
+                    ), unsafe_allow_html=True)
                 else:
                     st.info("No timeline events found. Run demo.py to create sample data.")
             except Exception as e:
@@ -460,14 +246,14 @@ with tab4:
         if st.button("💾 Save Text Record"):
             if symptom_text:
                 try:
-                    orchestrator.initialize()
+                    careledger = get_orchestrator()
                     request = IngestionRequest(
                         patient_id=demo_patient,
                         record_type=RecordType.SYMPTOM,
                         modality=Modality.TEXT,
                         content=symptom_text
                     )
-                    result = orchestrator.ingest_record(request)
+                    result = careledger.ingest_record(request)
                     st.success("✅ Record saved successfully!")
                 except Exception as e:
                     st.error(f"Error: {str(e)}")
@@ -5,7 +5,11 @@ User-friendly interface for interacting with CareLedger
 import streamlit as st
 import sys
 import os
+import shutil
+import time
 from datetime import datetime, timedelta
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import json
 
 # Add parent directory to path
@@ -13,7 +17,7 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from orchestrator import orchestrator
 from models.schemas import (
-    PatientQuery, IngestionRequest, RecordType, Modality
+    PatientQuery, IngestionRequest, RecordType, Modality, RetrievalResult
 )
 
 # Page configuration
@@ -25,7 +29,7 @@ st.set_page_config(
 )
 
 # Custom CSS
-st.markdown("""
+CUSTOM_CSS = """
 <style>
     .main-header {
         font-size: 3rem;
@@ -66,19 +70,97 @@ st.markdown("""
         margin: 0.5rem 0;
     }
 </style>
-""", unsafe_allow_html=True)
+"""
+
+# Re-emitted every run since Streamlit drops elements a rerun does not redraw
+st.html(CUSTOM_CSS)
+
+# Result fields shown by Query History's "View Details"
+DETAIL_FIELDS = {
+    "similar_cases": {"__all__": {"record_type", "date", "similarity_score"}},
+    "recommendations": True,
+    "safety_disclaimer": True,
+}
+
+# Home page example queries, keyed by button label
+QUICK_EXAMPLES = {
+    "Recurring symptoms": "I'm experiencing symptoms similar to 6 months ago. What happened then?",
+    "Past treatments": "What treatments have I tried for similar conditions?",
+    "Doctor questions": "What should I ask my doctor about this recurring issue?",
+}
 
 # Initialize session state
-if 'initialized' not in st.session_state:
-    st.session_state.initialized = False
+if 'patient_id' not in st.session_state:
     st.session_state.patient_id = "demo_patient_001"
-    st.session_state.query_history = []
+    st.session_state.query_history = deque(maxlen=50)
+    st.session_state.pending_ingestions = []
+    st.session_state.pending_writes = []
+
+# Initialize orchestrator once per server process, shared by all sessions
+@st.cache_resource(show_spinner="Initializing CareLedger...")
+def get_orchestrator():
+    """Initialize the orchestrator and return the shared instance"""
+    orchestrator.initialize()
+    return orchestrator
+
+careledger = get_orchestrator()
+
+# Create the upload directory once per server process rather than per upload
+@st.cache_resource(show_spinner=False)
+def get_upload_dir():
+    """Create the upload directory and return its path"""
+    upload_dir = "data/uploads"
+    os.makedirs(upload_dir, exist_ok=True)
+    return upload_dir
+
+# Queued uploads are written in the background and awaited on commit
+@st.cache_resource(show_spinner=False)
+def get_upload_writer():
+    """Return the shared thread pool for writing uploaded files"""
+    return ThreadPoolExecutor(max_workers=2)
+
+def add_display_fields(result: RetrievalResult) -> RetrievalResult:
+    """Format display strings once so cached reruns skip strftime"""
+    for case in result.similar_cases:
+        case._date_str = case.date.strftime('%B %d, %Y')
+        case._similarity_pct = f"{case.similarity_score:.0%}"
+    return result
+
+def stream_process_query(patient_id: str, query_text: str, results: list):
+    """Yield the explanation as Gemini streams it; the final result is appended to results"""
+    for chunk in careledger.process_query_stream(PatientQuery(patient_id=patient_id, query_text=query_text)):
+        if isinstance(chunk, RetrievalResult):
+            results.append(add_display_fields(chunk))
+        else:
+            yield chunk
+
+@st.cache_data(ttl=60, show_spinner=False)
+def cached_patient_timeline(patient_id: str):
+    """Fetch a patient's timeline, memoized by patient"""
+    timeline = careledger.get_patient_timeline(patient_id)
+    for event in timeline.events:
+        event._date_str = event.date.strftime('%B %d, %Y')
+    return timeline
 
-# Initialize orchestrator
-if not st.session_state.initialized:
-    with st.spinner("Initializing CareLedger..."):
-        orchestrator.initialize()
-        st.session_state.initialized = True
+@st.cache_data(ttl=60, show_spinner=False)
+def cached_memory_summary(patient_id: str):
+    """Fetch a patient's memory summary, memoized by patient"""
+    return careledger.get_memory_summary(patient_id)
+
+def save_upload(uploaded_file, file_path: str):
+    """Copy an uploaded file to disk in 1 MiB chunks"""
+    uploaded_file.seek(0)
+    with open(file_path, "wb") as f:
+        shutil.copyfileobj(uploaded_file, f, 1 << 20)
+
+def set_query_text(text: str):
+    """Fill the query box; runs as a callback so the text area shows it on this rerun"""
+    st.session_state.query_text = text
+
+def clear_patient_caches():
+    """Drop cached results after records change"""
+    cached_patient_timeline.clear()
+    cached_memory_summary.clear()
 
 # Sidebar
 with st.sidebar:
@@ -105,7 +187,7 @@ with st.sidebar:
     # Memory summary in sidebar
     if st.button("View Memory Summary"):
         with st.spinner("Loading memory summary..."):
-            summary = orchestrator.get_memory_summary(patient_id)
+            summary = cached_memory_summary(patient_id)
             st.session_state.show_summary = True
             st.session_state.memory_summary = summary
 
@@ -132,69 +214,70 @@ if page == "🏠 Home":
         query_text = st.text_area(
             "Enter your question or describe your symptoms:",
             placeholder="Example: I'm experiencing headaches similar to what I had last year. What did the doctor recommend back then?",
-            height=100
+            height=100,
+            key="query_text"
         )
     
     with col2:
         st.markdown("##### Quick Examples")
-        if st.button("Recurring symptoms"):
-            query_text = "I'm experiencing symptoms similar to 6 months ago. What happened then?"
-        if st.button("Past treatments"):
-            query_text = "What treatments have I tried for similar conditions?"
-        if st.button("Doctor questions"):
-            query_text = "What should I ask my doctor about this recurring issue?"
+        for label, text in QUICK_EXAMPLES.items():
+            st.button(label, on_click=set_query_text, args=(text,))
     
     if st.button("🔍 Search Medical History", type="primary", use_container_width=True):
         if query_text:
             with st.spinner("Analyzing your medical history..."):
-                # Process query
-                query = PatientQuery(
-                    patient_id=patient_id,
-                    query_text=query_text
-                )
+                st.markdown("---")
+                st.markdown("### 📋 Results")
                 
-                result = orchestrator.process_query(query)
+                # Process query, showing the explanation as soon as it starts
+                results = []
+                st.write_stream(stream_process_query(patient_id, query_text, results))
+                result = results[0]
                 
-                # Store in history
+                # Store in history with a compact snapshot of the answer, so
+                # viewing it later never re-runs the query (and its reinforcement)
                 st.session_state.query_history.append({
                     "timestamp": datetime.now(),
+                    "patient_id": patient_id,
                     "query": query_text,
-                    "result": result
+                    "summary": {
+                        "n_similar": len(result.similar_cases),
+                        "n_recs": len(result.recommendations)
+                    },
+                    # Only the fields worth showing; encoded with orjson by the model
+                    "details": result.model_dump_json(include=DETAIL_FIELDS)
                 })
                 
-                # Display results
-                st.markdown("---")
-                st.markdown("### 📋 Results")
-                
-                # Similar cases
-                if result.similar_cases:
-                    st.markdown("#### 🔄 Similar Past Cases")
-                    for i, case in enumerate(result.similar_cases[:5], 1):
-                        with st.expander(f"{i}. {case.record_type} - {case.date.strftime('%B %d, %Y')} (Similarity: {case.similarity_score:.0%})"):
-                            st.markdown(f"**Content:** {case.content[:300]}...")
-                            st.markdown(f"**Relevance:** {case.relevance_explanation}")
+                # First-visit fast path: no section has anything to show
+                has_any = bool(result.similar_cases or result.forgotten_insights or result.recommendations)
+                if not has_any:
+                    st.info("No matching history yet — add more records to improve results.")
                 else:
-                    st.info("No similar cases found in your medical history.")
-                
-                # Forgotten insights
-                if result.forgotten_insights:
-                    st.markdown("#### 💡 Forgotten Insights")
-                    for insight in result.forgotten_insights:
-                        st.markdown(f"""
-                        <div class="insight-box">
-                            🔍 {insight}
-                        </div>
-                        """, unsafe_allow_html=True)
-                
-                # Recommendations
-                if result.recommendations:
-                    st.markdown("#### ✅ Recommendations")
-                    for i, rec in enumerate(result.recommendations, 1):
-                        st.markdown(f"""
-                        <div class="recommendation-box">
-                            {i}. {rec}
-                        </div>
-                        """, unsafe_allow_html=True)
+                    # Similar cases
+                    if result.similar_cases:
+                        st.markdown("#### 🔄 Similar Past Cases")
+                        for i, case in enumerate(result.similar_cases[:5], 1):
+                            with st.expander(f"{i}. {case.record_type} - {case._date_str} (Similarity: {case._similarity_pct})"):
+                                st.markdown(f"**Content:** {case.content[:300]}...")
+                                st.markdown(f"**Relevance:** {case.relevance_explanation}")
+                    else:
+                        st.info("No similar cases found in your medical history.")
+                    
+                    # Forgotten insights
+                    if result.forgotten_insights:
+                        st.markdown("#### 💡 Forgotten Insights")
+                        st.markdown("\n".join(
+                            f'<div class="insight-box">\n🔍 {insight}\n</div>'
+                            for insight in result.forgotten_insights
+                        ), unsafe_allow_html=True)
+                    
+                    # Recommendations
+                    if result.recommendations:
+                        st.markdown("#### ✅ Recommendations")
+                        st.markdown("\n".join(
+                            f'<div class="recommendation-box">\n{i}. {rec}\n</div>'
+                            for i, rec in enumerate(result.recommendations, 1)
+                        ), unsafe_allow_html=True)
                 
                 # Safety disclaimer
                 st.markdown("---")
@@ -206,27 +289,45 @@ elif page == "🔍 Query History":
     st.markdown("## 🔍 Query History")
     
     if st.session_state.query_history:
-        for i, entry in enumerate(reversed(st.session_state.query_history), 1):
-            with st.expander(f"Query {len(st.session_state.query_history) - i + 1}: {entry['query'][:50]}... ({entry['timestamp'].strftime('%Y-%m-%d %H:%M')})"):
+        # Render one page of entries so the widget count stays bounded
+        history = list(reversed(st.session_state.query_history))
+        page_size = 20
+        page_count = (len(history) + page_size - 1) // page_size
+        page_num = st.number_input("Page", min_value=1, max_value=page_count, value=1)
+        start = (page_num - 1) * page_size
+        page_entries = {
+            f"Query {len(history) - i}": entry
+            for i, entry in enumerate(history[start:start + page_size], start)
+        }
+        
+        for label, entry in page_entries.items():
+            with st.expander(f"{label}: {entry['query'][:50]}... ({entry['timestamp'].strftime('%Y-%m-%d %H:%M')})"):
                 st.markdown(f"**Query:** {entry['query']}")
                 st.markdown(f"**Time:** {entry['timestamp'].strftime('%B %d, %Y at %I:%M %p')}")
                 
-                result = entry['result']
+                summary = entry['summary']
                 
-                st.markdown(f"**Similar Cases Found:** {len(result.similar_cases)}")
-                st.markdown(f"**Recommendations:** {len(result.recommendations)}")
-                
-                if st.button(f"View Details {i}", key=f"view_{i}"):
-                    st.json(result.dict())
+                st.markdown(f"**Similar Cases Found:** {summary['n_similar']}")
+                st.markdown(f"**Recommendations:** {summary['n_recs']}")
+        
+        selected = st.selectbox("View Details", list(page_entries), index=None, placeholder="Select a query")
+        if selected:
+            st.json(page_entries[selected]['details'])
     else:
         st.info("No query history yet. Start by asking a question on the Home page!")
 
 elif page == "📊 Timeline":
     st.markdown("## 📊 Medical Timeline")
     
+    page_size = 25
+    
     if st.button("Load Timeline"):
+        st.session_state.timeline_loaded = True
+        st.session_state.timeline_offset = 0
+    
+    if st.session_state.get("timeline_loaded"):
         with st.spinner("Loading your medical timeline..."):
-            timeline = orchestrator.get_patient_timeline(patient_id)
+            timeline = cached_patient_timeline(patient_id)
             
             if timeline.events:
                 st.success(f"Found {timeline.total_records} medical records")
@@ -241,14 +342,31 @@ elif page == "📊 Timeline":
                 
                 st.markdown("---")
                 
-                # Timeline visualization
-                for event in reversed(timeline.events):
-                    st.markdown(f"""
-                    <div class="timeline-event">
-                        <strong>{event.date.strftime('%B %d, %Y')}</strong> - {event.title}<br>
-                        <small>{event.description}</small>
-                    </div>
-                    """, unsafe_allow_html=True)
+                # Timeline visualization, newest first, one page at a time
+                total = len(timeline.events)
+                offset = min(st.session_state.timeline_offset, (total - 1) // page_size * page_size)
+                page_events = timeline.events[max(total - offset - page_size, 0):total - offset]
+                
+                st.markdown("\n".join(
+                    f'<div class="timeline-event">\n'
+                    f'<strong>{event._date_str}</strong> - {event.title}<br>\n'
+                    f'<small>{event.description}</small>\n'
+                    f'</div>'
+                    for event in reversed(page_events)
+                ), unsafe_allow_html=True)
+                
+                if total > page_size:
+                    col1, col2, col3 = st.columns([1, 2, 1])
+                    with col1:
+                        if st.button("⬅️ Newer", disabled=offset == 0):
+                            st.session_state.timeline_offset = offset - page_size
+                            st.rerun()
+                    with col2:
+                        st.caption(f"Showing {offset + 1}-{offset + len(page_events)} of {total}")
+                    with col3:
+                        if st.button("Older ➡️", disabled=offset + page_size >= total):
+                            st.session_state.timeline_offset = offset + page_size
+                            st.rerun()
             else:
                 st.info("No medical records found. Upload some records to build your timeline!")
 
@@ -295,9 +413,10 @@ elif page == "📁 Upload Records":
                 )
                 
                 with st.spinner("Saving record..."):
-                    result = orchestrator.ingest_record(request)
+                    result = careledger.ingest_record(request)
                     
                     if result.get("success"):
+                        clear_patient_caches()
                         st.success(f"✅ {result.get('message')}")
                     else:
                         st.error(f"❌ {result.get('error')}")
@@ -320,16 +439,12 @@ elif page == "📁 Upload Records":
             
             if st.button("📤 Upload PDF"):
                 # Save file
-                upload_dir = "data/uploads"
-                os.makedirs(upload_dir, exist_ok=True)
-                
                 file_path = os.path.join(
-                    upload_dir,
-                    f"{patient_id}_{datetime.now().timestamp()}_{uploaded_file.name}"
+                    get_upload_dir(),
+                    f"{patient_id}_{time.time_ns()}_{uploaded_file.name}"
                 )
                 
-                with open(file_path, "wb") as f:
-                    f.write(uploaded_file.getbuffer())
+                save_upload(uploaded_file, file_path)
                 
                 # Create ingestion request
                 request = IngestionRequest(
@@ -341,9 +456,10 @@ elif page == "📁 Upload Records":
                 )
                 
                 with st.spinner("Processing PDF..."):
-                    result = orchestrator.ingest_record(request)
+                    result = careledger.ingest_record(request)
                     
                     if result.get("success"):
+                        clear_patient_caches()
                         st.success(f"✅ {result.get('message')}")
                     else:
                         st.error(f"❌ {result.get('error')}")
@@ -363,21 +479,20 @@ elif page == "📁 Upload Records":
             scan_type = st.text_input("Scan Type", placeholder="e.g., X-Ray, MRI, CT Scan")
             body_part = st.text_input("Body Part", placeholder="e.g., Chest, Knee, Head")
             
-            if st.button("📤 Upload Image"):
-                # Save file
-                upload_dir = "data/uploads"
-                os.makedirs(upload_dir, exist_ok=True)
-                
+            if st.button("➕ Add to Upload Queue"):
+                # Choose the upload path
                 file_path = os.path.join(
-                    upload_dir,
-                    f"{patient_id}_{datetime.now().timestamp()}_{uploaded_image.name}"
+                    get_upload_dir(),
+                    f"{patient_id}_{time.time_ns()}_{uploaded_image.name}"
+                )
+                # Images are indexed by their description, so the write only
+                # has to finish by the time the queue is committed
+                st.session_state.pending_writes.append(
+                    get_upload_writer().submit(save_upload, uploaded_image, file_path)
                 )
                 
-                with open(file_path, "wb") as f:
-                    f.write(uploaded_image.getbuffer())
-                
-                # Create ingestion request
-                request = IngestionRequest(
+                # Queue the ingestion request; embedding happens on commit
+                st.session_state.pending_ingestions.append(IngestionRequest(
                     patient_id=patient_id,
                     record_type=RecordType.SCAN,
                     modality=Modality.IMAGE,
@@ -387,15 +502,34 @@ elif page == "📁 Upload Records":
                         "scan_type": scan_type,
                         "body_part": body_part
                     }
-                )
-                
-                with st.spinner("Processing image..."):
-                    result = orchestrator.ingest_record(request)
+                ))
+        
+        pending = st.session_state.pending_ingestions
+        if pending:
+            st.info(f"🗂️ {len(pending)} image(s) queued for upload")
+            
+            if st.button(f"📤 Commit {len(pending)} records"):
+                with st.spinner("Processing images..."):
+                    # One batched embedding call and upsert for the whole queue
+                    result = careledger.batch_ingest(pending)
                     
-                    if result.get("success"):
-                        st.success(f"✅ {result.get('message')}")
-                    else:
-                        st.error(f"❌ {result.get('error')}")
+                    # Wait for the file writes that ran alongside the queue
+                    write_errors = []
+                    for write in st.session_state.pending_writes:
+                        try:
+                            write.result()
+                        except Exception as e:
+                            write_errors.append(e)
+                
+                st.session_state.pending_ingestions = []
+                st.session_state.pending_writes = []
+                if result["success_count"]:
+                    clear_patient_caches()
+                    st.success(f"✅ Ingested {result['success_count']} of {result['total']} records")
+                for failure in result["results"]["failed"]:
+                    st.error(f"❌ {failure.get('error')}")
+                for error in write_errors:
+                    st.error(f"❌ Could not save image: {error}")
 
 else:  # Settings page
     st.markdown("## ⚙️ Settings")
@@ -407,7 +541,7 @@ else:  # Settings page
         
         if st.button("🔍 Analyze Memory Health"):
             with st.spinner("Analyzing..."):
-                summary = orchestrator.get_memory_summary(patient_id)
+                summary = cached_memory_summary(patient_id)
                 
                 if summary.get("total_records", 0) > 0:
                     col1, col2, col3 = st.columns(3)
@@ -438,7 +572,8 @@ else:  # Settings page
         
         if st.button("🔧 Apply Memory Maintenance"):
             with st.spinner("Applying maintenance..."):
-                result = orchestrator.apply_memory_maintenance(patient_id)
+                result = careledger.apply_memory_maintenance(patient_id)
+                clear_patient_caches()
                 if result.get("success"):
                     st.success("✅ Memory maintenance completed")
     
@@ -446,10 +581,10 @@ else:  # Settings page
         st.markdown("### Privacy & Ethics")
         
         with st.expander("📜 Informed Consent"):
-            st.markdown(orchestrator.get_consent_notice())
+            st.markdown(careledger.get_consent_notice())
         
         with st.expander("🔒 Data Usage Policy"):
-            st.markdown(orchestrator.get_data_usage_policy())
+            st.markdown(careledger.get_data_usage_policy())
         
         st.markdown("---")
         st.markdown("#### Data Control")
@@ -468,7 +603,7 @@ else:  # Settings page
         if st.button("Analyze Symptom Progression"):
             if symptom_input:
                 with st.spinner("Analyzing..."):
-                    result = orchestrator.analyze_symptom_progression(
+                    result = careledger.analyze_symptom_progression(
                         patient_id=patient_id,
                         symptom=symptom_input,
                         time_window_days=time_window
@@ -5,14 +5,18 @@ Checks that all files work together correctly
 """
 import sys
 import os
-import ast
+import json
+from concurrent.futures import ProcessPoolExecutor
 
-print("="*70)
-print("CARELEDGER COMPATIBILITY VERIFICATION")
-print("="*70)
+from utils.cache import file_key
+
+try:
+    import ahocorasick  # Optional: matches all patterns in one pass per file
+except ImportError:
+    ahocorasick = None
+
+CACHE_FILE = '.compat_cache.json'
 
-# Check 1: Python syntax
-print("\n1. Checking Python Syntax...")
 files_to_check = [
     'config.py',
     'models/schemas.py',
@@ -33,22 +37,6 @@ files_to_check = [
     'run_tests.py'
 ]
 
-syntax_ok = True
-for filepath in files_to_check:
-    if os.path.exists(filepath):
-        try:
-            with open(filepath, 'r') as f:
-                ast.parse(f.read())
-            print(f"  ✓ {filepath}")
-        except SyntaxError as e:
-            print(f"  ✗ {filepath}: Syntax error at line {e.lineno}")
-            syntax_ok = False
-    else:
-        print(f"  ⚠ {filepath}: Not found")
-
-# Check 2: Import structure
-print("\n2. Checking Import Structure...")
-
 required_exports = {
     'config.py': ['settings'],
     'models/schemas.py': ['RecordType', 'Modality', 'MedicalRecord', 'PatientQuery', 
@@ -65,26 +53,6 @@ required_exports = {
     'orchestrator.py': ['orchestrator', 'CareLedgerOrchestrator'],
 }
 
-import_ok = True
-for filepath, required in required_exports.items():
-    if os.path.exists(filepath):
-        with open(filepath, 'r') as f:
-            content = f.read()
-            missing = []
-            for item in required:
-                # Check for class definitions or variable assignments
-                if f"class {item}" not in content and f"{item} =" not in content:
-                    missing.append(item)
-            
-            if missing:
-                print(f"  ✗ {filepath}: Missing exports: {', '.join(missing)}")
-                import_ok = False
-            else:
-                print(f"  ✓ {filepath}")
-
-# Check 3: Cross-file dependencies
-print("\n3. Checking Cross-File Dependencies...")
-
 dependencies = {
     'orchestrator.py': [
         'from agents.ingestion_agent import ingestion_agent',
@@ -110,16 +78,157 @@ dependencies = {
     ],
 }
 
-deps_ok = True
-for filepath, expected_imports in dependencies.items():
-    if os.path.exists(filepath):
-        with open(filepath, 'r') as f:
-            content = f.read()
-            missing = []
-            for imp in expected_imports:
-                if imp not in content:
-                    missing.append(imp)
-            
+def export_patterns(item):
+    """Patterns that count as defining an export: a class, an assignment or a lazy factory"""
+    return (f"class {item}", f"{item} =", f"def get_{item}(")
+
+
+def file_patterns(filepath):
+    """All export and import patterns checked for a file"""
+    patterns = list(dependencies.get(filepath, []))
+    for item in required_exports.get(filepath, []):
+        patterns.extend(export_patterns(item))
+    return patterns
+
+
+def find_patterns(content, patterns):
+    """Return the patterns that occur in content"""
+    if ahocorasick is None or not patterns:
+        return {pattern for pattern in patterns if pattern in content}
+    
+    automaton = ahocorasick.Automaton()
+    for pattern in patterns:
+        automaton.add_word(pattern, pattern)
+    automaton.make_automaton()
+    return {pattern for _, pattern in automaton.iter(content)}
+
+
+def check_file(filepath, patterns):
+    """Syntax-check a file and return its error line (or None) and the patterns it contains"""
+    with open(filepath, 'r') as f:
+        content = f.read()
+    
+    try:
+        # Same check as py_compile, without writing a .pyc
+        compile(content, filepath, 'exec', dont_inherit=True)
+        syntax_error = None
+    except SyntaxError as e:
+        syntax_error = e.lineno
+    
+    return syntax_error, find_patterns(content, patterns)
+
+
+def load_cache():
+    """Load per-file results from the last run, discarding them if Python changed"""
+    try:
+        with open(CACHE_FILE, 'r') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return cache.get('files', {}) if cache.get('python') == sys.version else {}
+
+
+def save_cache(files):
+    """Store per-file results for the next run"""
+    try:
+        with open(CACHE_FILE, 'w') as f:
+            json.dump({'python': sys.version, 'files': files}, f)
+    except OSError:
+        pass
+
+
+def cached_result(entry, filepath, patterns):
+    """Return the cached result for an unchanged file, or None"""
+    if entry is None or entry['patterns'] != patterns:
+        return None
+    
+    stat = os.stat(filepath)
+    if [stat.st_mtime_ns, stat.st_size] != entry['stat']:
+        # mtime changes on checkout or touch; fall back to the content hash
+        if stat.st_size != entry['stat'][1] or file_key(filepath) != entry['hash']:
+            return None
+        entry['stat'] = [stat.st_mtime_ns, stat.st_size]
+    
+    return entry['syntax_error'], set(entry['found'])
+
+
+def main():
+    """Run all compatibility checks"""
+    print("="*70)
+    print("CARELEDGER COMPATIBILITY VERIFICATION")
+    print("="*70)
+
+    # Check 1: Python syntax
+    print("\n1. Checking Python Syntax...")
+    existing_files = [filepath for filepath in files_to_check if os.path.exists(filepath)]
+    patterns = {filepath: file_patterns(filepath) for filepath in existing_files}
+
+    # Reuse results for files unchanged since the last run
+    cache = load_cache()
+    results = {}
+    for filepath in existing_files:
+        result = cached_result(cache.get(filepath), filepath, patterns[filepath])
+        if result is not None:
+            results[filepath] = result
+    changed_files = [filepath for filepath in existing_files if filepath not in results]
+
+    # Each changed file is read once and checked in parallel
+    if changed_files:
+        with ProcessPoolExecutor() as executor:
+            results.update(zip(changed_files, executor.map(
+                check_file,
+                changed_files,
+                [patterns[filepath] for filepath in changed_files]
+            )))
+
+        for filepath in changed_files:
+            stat = os.stat(filepath)
+            syntax_error, found = results[filepath]
+            cache[filepath] = {
+                'stat': [stat.st_mtime_ns, stat.st_size],
+                'hash': file_key(filepath),
+                'patterns': patterns[filepath],
+                'syntax_error': syntax_error,
+                'found': sorted(found),
+            }
+    save_cache(cache)
+
+    syntax_ok = True
+    for filepath in files_to_check:
+        if filepath in results:
+            syntax_error, _ = results[filepath]
+            if syntax_error is None:
+                print(f"  ✓ {filepath}")
+            else:
+                print(f"  ✗ {filepath}: Syntax error at line {syntax_error}")
+                syntax_ok = False
+        else:
+            print(f"  ⚠ {filepath}: Not found")
+
+    # Check 2: Import structure
+    print("\n2. Checking Import Structure...")
+
+    import_ok = True
+    for filepath, required in required_exports.items():
+        if filepath in results:
+            _, found = results[filepath]
+            missing = [item for item in required if not found & set(export_patterns(item))]
+        
+            if missing:
+                print(f"  ✗ {filepath}: Missing exports: {', '.join(missing)}")
+                import_ok = False
+            else:
+                print(f"  ✓ {filepath}")
+
+    # Check 3: Cross-file dependencies
+    print("\n3. Checking Cross-File Dependencies...")
+
+    deps_ok = True
+    for filepath, expected_imports in dependencies.items():
+        if filepath in results:
+            _, found = results[filepath]
+            missing = [imp for imp in expected_imports if imp not in found]
+        
             if missing:
                 print(f"  ✗ {filepath}: Missing imports")
                 for m in missing:
@@ -128,73 +237,77 @@ for filepath, expected_imports in dependencies.items():
             else:
                 print(f"  ✓ {filepath}")
 
-# Check 4: File structure
-print("\n4. Checking File Structure...")
-
-required_structure = {
-    'agents/__init__.py': True,
-    'models/__init__.py': True,
-    'utils/__init__.py': True,
-    'tests/__init__.py': True,
-    'data/uploads/.gitkeep': True,
-    '.env.example': True,
-    '.gitignore': True,
-    'requirements.txt': True,
-    'README.md': True,
-    'LICENSE': True,
-}
+    # Check 4: File structure
+    print("\n4. Checking File Structure...")
 
-structure_ok = True
-for filepath, required in required_structure.items():
-    if os.path.exists(filepath):
-        print(f"  ✓ {filepath}")
-    else:
-        print(f"  ✗ {filepath}: Missing")
-        structure_ok = False
+    required_structure = {
+        'agents/__init__.py': True,
+        'models/__init__.py': True,
+        'utils/__init__.py': True,
+        'tests/__init__.py': True,
+        'data/uploads/.gitkeep': True,
+        '.env.example': True,
+        '.gitignore': True,
+        'requirements.txt': True,
+        'README.md': True,
+        'LICENSE': True,
+    }
+
+    structure_ok = True
+    for filepath, required in required_structure.items():
+        if os.path.exists(filepath):
+            print(f"  ✓ {filepath}")
+        else:
+            print(f"  ✗ {filepath}: Missing")
+            structure_ok = False
 
-# Check 5: Pydantic model compatibility
-print("\n5. Checking Pydantic Model Compatibility...")
+    # Check 5: Pydantic model compatibility
+    print("\n5. Checking Pydantic Model Compatibility...")
 
-# Check RetrievalResult has all required fields
-if os.path.exists('models/schemas.py'):
-    with open('models/schemas.py', 'r') as f:
-        content = f.read()
+    # Check RetrievalResult has all required fields
+    if os.path.exists('models/schemas.py'):
+        with open('models/schemas.py', 'r') as f:
+            content = f.read()
         
-        required_fields = [
-            'evidence_trace',
-            'reasoning_steps',
-            'evidence_summary'
-        ]
+            required_fields = [
+                'evidence_trace',
+                'reasoning_steps',
+                'evidence_summary'
+            ]
         
-        model_ok = True
-        for field in required_fields:
-            if field not in content or 'RetrievalResult' not in content:
-                print(f"  ✗ RetrievalResult missing field: {field}")
-                model_ok = False
+            model_ok = True
+            for field in required_fields:
+                if field not in content or 'RetrievalResult' not in content:
+                    print(f"  ✗ RetrievalResult missing field: {field}")
+                    model_ok = False
         
-        if model_ok:
-            print("  ✓ RetrievalResult has all required fields")
-
-# Final summary
-print("\n" + "="*70)
-print("SUMMARY")
-print("="*70)
-
-all_ok = syntax_ok and import_ok and deps_ok and structure_ok
-
-if all_ok:
-    print("✅ All compatibility checks passed!")
-    print("\n🎉 CareLedger is ready to run!")
-    print("\nNext steps:")
-    print("  1. pip install -r requirements.txt")
-    print("  2. cp .env.example .env")
-    print("  3. Add GEMINI_API_KEY to .env")
-    print("  4. python demo.py")
-    print("  5. streamlit run app.py")
-else:
-    print("❌ Some compatibility issues found")
-    print("\nPlease fix the issues above before running")
-
-print("="*70)
-
-sys.exit(0 if all_ok else 1)
+            if model_ok:
+                print("  ✓ RetrievalResult has all required fields")
+
+    # Final summary
+    print("\n" + "="*70)
+    print("SUMMARY")
+    print("="*70)
+
+    all_ok = syntax_ok and import_ok and deps_ok and structure_ok
+
+    if all_ok:
+        print("✅ All compatibility checks passed!")
+        print("\n🎉 CareLedger is ready to run!")
+        print("\nNext steps:")
+        print("  1. pip install -r requirements.txt")
+        print("  2. cp .env.example .env")
+        print("  3. Add GEMINI_API_KEY to .env")
+        print("  4. python demo.py")
+        print("  5. streamlit run app.py")
+    else:
+        print("❌ Some compatibility issues found")
+        print("\nPlease fix the issues above before running")
+
+    print("="*70)
+
+    return 0 if all_ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
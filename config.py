@@ -3,12 +3,13 @@ Configuration module for CareLedger
 """
 import os
 from dotenv import load_dotenv
-from pydantic import BaseModel
+from dataclasses import dataclass
 from typing import Optional
 
 load_dotenv()
 
-class Settings(BaseModel):
+@dataclass(frozen=True)
+class Settings:
     # Gemini Configuration
     GEMINI_API_KEY: str = os.getenv("GEMINI_API_KEY", "")
     
@@ -16,10 +17,14 @@ class Settings(BaseModel):
     QDRANT_HOST: str = os.getenv("QDRANT_HOST", "localhost")
     QDRANT_PORT: int = int(os.getenv("QDRANT_PORT", "6333"))
     QDRANT_API_KEY: Optional[str] = os.getenv("QDRANT_API_KEY")
+    QDRANT_IN_MEMORY: bool = os.getenv("QDRANT_IN_MEMORY", "True").lower() == "true"
+    QDRANT_PATH: str = os.getenv("QDRANT_PATH", "")  # Persist the embedded store here, empty keeps it in memory
     
     # Application Configuration
     APP_NAME: str = os.getenv("APP_NAME", "CareLedger")
     DEBUG: bool = os.getenv("DEBUG", "True").lower() == "true"
+    API_WORKER_THREADS: int = int(os.getenv("API_WORKER_THREADS", "32"))  # Threads for blocking API work
+    API_WORKERS: int = int(os.getenv("API_WORKERS", "1"))  # Server processes; response caches are per process
     
     # Collection Names
     PATIENT_COLLECTION: str = "patient_memory"
@@ -36,8 +41,5 @@ class Settings(BaseModel):
     # Memory Configuration
     MEMORY_DECAY_DAYS: int = 365  # Days after which old memories start decaying
     REINFORCEMENT_THRESHOLD: int = 3  # Number of similar queries to reinforce memory
-    
-    class Config:
-        env_file = ".env"
 
 settings = Settings()
@@ -8,8 +8,43 @@ Watch the memory weights increase with each access!
 
 from orchestrator import orchestrator
 from models.schemas import PatientQuery
+from demo import create_sample_patient_data, has_sample_patient_data
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+import argparse
+import sys
 import time
 
+# Printed after the repeated queries, as one write instead of a print per line
+MEMORY_EVOLUTION_SUMMARY = "\n".join([
+    "",
+    "=" * 70,
+    "🎯 MEMORY EVOLUTION SUMMARY",
+    "=" * 70,
+    "",
+    "Look at the MEMORY REINFORCEMENT blocks above. Each one shows a",
+    "retrieved record's values before → after that access:",
+    "",
+    "  • Access count: +1 for every record a query retrieves",
+    "  • Memory weight: 1 + 0.05 × accesses, rising to 1 + 0.10 × accesses",
+    "    (capped at 1.3) once a record reaches 3 accesses",
+    "  • ✨ LEVEL UP: printed when a record crosses a reinforcement level",
+    "",
+    "Starting values are whatever the records held before this run, so they",
+    "may differ from the 1.000 / 0 a freshly ingested record starts with.",
+    "",
+    "This is EXPLICIT MEMORY EVOLUTION - the system learns what's important!",
+    "",
+    "=" * 70,
+    "",
+    "💡 Key Insight:",
+    "   Frequently accessed memories = Important memories",
+    "   These resist temporal decay and rank higher in future searches",
+    "",
+    "=" * 70,
+    ""
+])
+
 
 def demonstrate_memory_evolution():
     """Demonstrate memory evolution through repeated queries"""
@@ -24,14 +59,18 @@ def demonstrate_memory_evolution():
     print()
     print("="*70 + "\n")
     
+    # The query
+    query_text = "What treatments have helped my headaches?"
+    patient_id = "demo_patient_001"
+    
     # Initialize orchestrator
     print("Initializing CareLedger...")
     orchestrator.initialize()
-    print("✅ Ready!\n")
     
-    # The query
-    query_text = "What treatments have helped my headaches?"
-    patient_id = "demo_patient_001"
+    # Reuse the sample history when demo.py already stored it
+    if not has_sample_patient_data(patient_id):
+        create_sample_patient_data(patient_id)
+    print("✅ Ready!\n")
     
     # Query 3 times
     for i in range(1, 4):
@@ -57,34 +96,7 @@ def demonstrate_memory_evolution():
             print("\n⏸️  Waiting 2 seconds before next query...")
             time.sleep(2)
     
-    print("\n" + "="*70)
-    print("🎯 MEMORY EVOLUTION SUMMARY")
-    print("="*70)
-    print()
-    print("Look at the console output above to see:")
-    print()
-    print("Query #1:")
-    print("  • Initial access: memory_weight starts at 1.000")
-    print("  • Access count: 0 → 1")
-    print()
-    print("Query #2:")
-    print("  • Reinforcement: memory_weight increases to ~1.050-1.100")
-    print("  • Access count: 1 → 2")
-    print()
-    print("Query #3:")
-    print("  • Strong reinforcement: memory_weight jumps to ~1.300")
-    print("  • Access count: 2 → 3")
-    print("  • ✨ LEVEL UP: reinforcement_level 0 → 1 (Low)")
-    print()
-    print("This is EXPLICIT MEMORY EVOLUTION - the system learns what's important!")
-    print()
-    print("="*70)
-    print()
-    print("💡 Key Insight:")
-    print("   Frequently accessed memories = Important memories")
-    print("   These resist temporal decay and rank higher in future searches")
-    print()
-    print("="*70 + "\n")
+    sys.stdout.write(MEMORY_EVOLUTION_SUMMARY + "\n")
 
 
 def demonstrate_forgotten_insight():
@@ -142,8 +154,16 @@ def demonstrate_forgotten_insight():
         print("\nNo forgotten insights found (data may need to be regenerated)")
 
 
-def main():
+def main(argv: Optional[List[str]] = None):
     """Run all demonstrations"""
+    parser = argparse.ArgumentParser(description="CareLedger live demonstration")
+    parser.add_argument(
+        "-y", "--yes", "--non-interactive",
+        dest="yes",
+        action="store_true",
+        help="Run the demos back to back without waiting for Enter"
+    )
+    args = parser.parse_args(argv)
     
     print("\n" + "="*70)
     print("🏥 CARELEDGER - LIVE DEMONSTRATION")
@@ -156,10 +176,16 @@ def main():
     print()
     print("="*70 + "\n")
     
-    input("Press Enter to start the Memory Evolution demo...")
+    # Load the models and vector store while the prompt waits
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        init_future = executor.submit(orchestrator.initialize)
+        if not args.yes:
+            input("Press Enter to start the Memory Evolution demo...")
+        init_future.result()
     demonstrate_memory_evolution()
     
-    input("\nPress Enter to start the Forgotten Insight demo...")
+    if not args.yes:
+        input("\nPress Enter to start the Forgotten Insight demo...")
     demonstrate_forgotten_insight()
     
     print("\n" + "="*70)
@@ -1,10 +1,17 @@
 """
 Data models for CareLedger
 """
-from pydantic import BaseModel, Field
-from typing import Optional, List, Dict, Any
+from pydantic import BaseModel, Field, ConfigDict, field_validator
+from typing import Optional, List, Dict, Any, Tuple, Mapping
+from dataclasses import dataclass, field, replace
 from datetime import datetime
 from enum import Enum
+import numpy as np
+import orjson
+import sys
+
+# orjson writes datetimes, enums and numpy values natively
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
 
 class RecordType(str, Enum):
     REPORT = "report"
@@ -19,8 +26,89 @@ class Modality(str, Enum):
     IMAGE = "image"
     AUDIO = "audio"
 
-class MedicalRecord(BaseModel):
+# Dictionary encoding of the enums for compact, vectorized column filters
+RECORD_TYPE_CODES = {record_type.value: code for code, record_type in enumerate(RecordType)}
+MODALITY_CODES = {modality.value: code for code, modality in enumerate(Modality)}
+UNKNOWN_CODE = 255  # Stored values outside the enum
+
+def encode_column(values: List[str], codes: Dict[str, int]) -> np.ndarray:
+    """Encode enum values as a uint8 code column"""
+    return np.fromiter(
+        (codes.get(value, UNKNOWN_CODE) for value in values),
+        dtype=np.uint8,
+        count=len(values)
+    )
+
+INTERN_MAX_LENGTH = 100  # Longer strings are rarely repeated verbatim
+
+def intern_strings(value: Any) -> Any:
+    """Intern short strings in nested metadata so repeated values share one object"""
+    if type(value) is str:
+        return sys.intern(value) if len(value) < INTERN_MAX_LENGTH else value
+    if isinstance(value, dict):
+        return {intern_strings(key): intern_strings(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [intern_strings(item) for item in value]
+    return value
+
+@dataclass(frozen=True)
+class RecordMetadata:
+    """
+    Compact, typed record metadata
+    Well-known keys get typed fields; anything else is kept in extras.
+    Converted to a plain dict when a request is validated, since payloads
+    and API clients use dicts
+    """
+    date: Optional[datetime] = None
+    diagnosis: Optional[str] = None
+    symptoms: Tuple[str, ...] = ()
+    medications: Tuple[str, ...] = ()
+    unfollowed_recommendation: Optional[str] = None
+    extras: Mapping[str, Any] = field(default_factory=dict)
+    
+    @classmethod
+    def from_dict(cls, metadata: Dict[str, Any]) -> "RecordMetadata":
+        """Split a metadata dict into the known fields and extras"""
+        extras = dict(metadata)
+        return cls(
+            date=extras.pop("date", None),
+            diagnosis=extras.pop("diagnosis", None),
+            symptoms=tuple(extras.pop("symptoms", ())),
+            medications=tuple(extras.pop("medications", ())),
+            unfollowed_recommendation=extras.pop("unfollowed_recommendation", None),
+            extras=extras
+        )
+    
+    def with_date(self, date: datetime) -> "RecordMetadata":
+        return replace(self, date=date)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Plain dict with only the fields that are set"""
+        metadata = {}
+        if self.date is not None:
+            metadata["date"] = self.date
+        if self.diagnosis is not None:
+            metadata["diagnosis"] = self.diagnosis
+        if self.symptoms:
+            metadata["symptoms"] = list(self.symptoms)
+        if self.medications:
+            metadata["medications"] = list(self.medications)
+        if self.unfollowed_recommendation is not None:
+            metadata["unfollowed_recommendation"] = self.unfollowed_recommendation
+        metadata.update(self.extras)
+        return metadata
+
+class OrjsonModel(BaseModel):
+    """Base model whose JSON encoding goes through orjson"""
+    
+    def model_dump_json(self, *, indent: Optional[int] = None, **kwargs) -> str:
+        option = (ORJSON_OPTIONS | orjson.OPT_INDENT_2) if indent else ORJSON_OPTIONS
+        return orjson.dumps(self.model_dump(**kwargs), option=option).decode()
+
+class MedicalRecord(OrjsonModel):
     """Base model for medical records"""
+    model_config = ConfigDict(frozen=True, extra='forbid')
+    
     patient_id: str
     record_id: str
     record_type: RecordType
@@ -30,6 +118,13 @@ class MedicalRecord(BaseModel):
     metadata: Dict[str, Any] = Field(default_factory=dict)
     source_file: Optional[str] = None
     
+    @field_validator("metadata", mode="before")
+    @classmethod
+    def intern_metadata(cls, metadata: Any) -> Any:
+        if isinstance(metadata, RecordMetadata):
+            metadata = metadata.to_dict()
+        return intern_strings(metadata)
+    
 class PatientQuery(BaseModel):
     """Model for patient queries"""
     patient_id: str
@@ -39,6 +134,8 @@ class PatientQuery(BaseModel):
 
 class SimilarCase(BaseModel):
     """Model for similar past cases"""
+    model_config = ConfigDict(frozen=True, extra='forbid')
+    
     record_id: str
     record_type: RecordType
     content: str
@@ -47,7 +144,7 @@ class SimilarCase(BaseModel):
     relevance_explanation: str
     metadata: Dict[str, Any]
 
-class RetrievalResult(BaseModel):
+class RetrievalResult(OrjsonModel):
     """Model for retrieval results with structured evidence"""
     query: str
     similar_cases: List[SimilarCase]
@@ -73,7 +170,7 @@ class RetrievalResult(BaseModel):
     class Config:
         arbitrary_types_allowed = True
 
-class IngestionRequest(BaseModel):
+class IngestionRequest(OrjsonModel):
     """Model for ingestion requests"""
     patient_id: str
     record_type: RecordType
@@ -81,9 +178,18 @@ class IngestionRequest(BaseModel):
     content: Optional[str] = None
     file_path: Optional[str] = None
     metadata: Dict[str, Any] = Field(default_factory=dict)
+    
+    @field_validator("metadata", mode="before")
+    @classmethod
+    def intern_metadata(cls, metadata: Any) -> Any:
+        if isinstance(metadata, RecordMetadata):
+            metadata = metadata.to_dict()
+        return intern_strings(metadata)
 
 class TimelineEvent(BaseModel):
     """Model for timeline events"""
+    model_config = ConfigDict(frozen=True, extra='forbid')
+    
     date: datetime
     event_type: str
     title: str
@@ -91,9 +197,102 @@ class TimelineEvent(BaseModel):
     record_id: str
     metadata: Dict[str, Any]
 
-class PatientTimeline(BaseModel):
+class PatientTimeline(OrjsonModel):
     """Model for patient timeline"""
     patient_id: str
     events: List[TimelineEvent]
     total_records: int
     date_range: Dict[str, datetime]
+
+class PatientTimelineColumnar(BaseModel):
+    """
+    Column-oriented patient timeline
+    Date-window and type filters run as one vectorized mask over the dates
+    and code columns; events are only built when converted back with to_timeline()
+    """
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+    
+    patient_id: str
+    dates: np.ndarray  # datetime64[us], chronological
+    event_types: np.ndarray
+    titles: np.ndarray
+    descriptions: np.ndarray
+    record_ids: np.ndarray
+    metadatas: np.ndarray
+    record_type_codes: np.ndarray  # uint8, see RECORD_TYPE_CODES
+    modality_codes: np.ndarray  # uint8, see MODALITY_CODES
+    
+    def filter_by_window(
+        self,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None
+    ) -> "PatientTimelineColumnar":
+        """Keep only events dated within [start, end]"""
+        mask = np.ones(len(self.dates), dtype=bool)
+        if start is not None:
+            mask &= self.dates >= np.datetime64(start, "us")
+        if end is not None:
+            mask &= self.dates <= np.datetime64(end, "us")
+        
+        return self._take(mask)
+    
+    def filter_types(
+        self,
+        record_types: Optional[List[RecordType]] = None,
+        modalities: Optional[List[Modality]] = None
+    ) -> "PatientTimelineColumnar":
+        """Keep only events of the given record types and/or modalities"""
+        mask = np.ones(len(self.dates), dtype=bool)
+        if record_types is not None:
+            codes = [RECORD_TYPE_CODES[RecordType(record_type).value] for record_type in record_types]
+            mask &= np.isin(self.record_type_codes, codes)
+        if modalities is not None:
+            codes = [MODALITY_CODES[Modality(modality).value] for modality in modalities]
+            mask &= np.isin(self.modality_codes, codes)
+        
+        return self._take(mask)
+    
+    def _take(self, mask: np.ndarray) -> "PatientTimelineColumnar":
+        return self.model_copy(update={
+            "dates": self.dates[mask],
+            "event_types": self.event_types[mask],
+            "titles": self.titles[mask],
+            "descriptions": self.descriptions[mask],
+            "record_ids": self.record_ids[mask],
+            "metadatas": self.metadatas[mask],
+            "record_type_codes": self.record_type_codes[mask],
+            "modality_codes": self.modality_codes[mask]
+        })
+    
+    def to_timeline(self) -> PatientTimeline:
+        """Materialize the columns as a PatientTimeline of events"""
+        # Columns come from our own store, so skip re-validation
+        events = [
+            TimelineEvent.model_construct(
+                date=date,
+                event_type=event_type,
+                title=title,
+                description=description,
+                record_id=record_id,
+                metadata=metadata
+            )
+            for date, event_type, title, description, record_id, metadata in zip(
+                self.dates.tolist(), self.event_types, self.titles,
+                self.descriptions, self.record_ids, self.metadatas
+            )
+        ]
+        
+        if events:
+            date_range = {
+                "earliest": events[0].date,
+                "latest": events[-1].date
+            }
+        else:
+            date_range = {}
+        
+        return PatientTimeline(
+            patient_id=self.patient_id,
+            events=events,
+            total_records=len(events),
+            date_range=date_range
+        )
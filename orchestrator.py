@@ -2,11 +2,15 @@
 CareLedger Main Orchestrator
 Coordinates all agents to process patient queries
 """
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple, Iterator, Union
+from concurrent.futures import Executor
 from datetime import datetime
+from functools import partial
+import asyncio
 from models.schemas import (
     PatientQuery, RetrievalResult, SimilarCase,
-    IngestionRequest, TimelineEvent, PatientTimeline
+    IngestionRequest, PatientTimeline, PatientTimelineColumnar,
+    RECORD_TYPE_CODES, MODALITY_CODES, encode_column, intern_strings
 )
 from agents.ingestion_agent import ingestion_agent
 from agents.memory_agent import memory_agent
@@ -16,6 +20,14 @@ from agents.recommendation_agent import recommendation_agent
 from utils.llm import gemini_llm
 from utils.vector_store import qdrant_manager
 from utils.embeddings import embedding_manager
+from utils.cache import query_result_cache
+import numpy as np
+
+def _object_column(values: List[Any]) -> np.ndarray:
+    """Build a 1-D object array without numpy unpacking nested values"""
+    column = np.empty(len(values), dtype=object)
+    column[:] = values
+    return column
 
 class CareLedgerOrchestrator:
     """
@@ -51,8 +63,175 @@ class CareLedgerOrchestrator:
         === JUDGE NARRATIVE MODE ===
         This pipeline explicitly shows each agent's role
         """
+        # Rejected and emergency queries are answered before loading any model
+        rejected = self._validate_query(query)
+        if rejected is not None:
+            return rejected
+        
         self.initialize()
         
+        query_embedding, cached = self._cached_query_result(query)
+        if cached is not None:
+            return cached
+        
+        similar_result, timeline, similar_cases = self._retrieve_context(query)
+        llm_failures = gemini_llm.failures
+        
+        # STEP 4: Generate explanation using LLM
+        print("🤖 STEP 4: GEMINI LLM - Generating Explanation")
+        print("-" * 70)
+        explanation = gemini_llm.explain_similar_cases(
+            query=query.query_text,
+            similar_cases=self._llm_case_payloads(similar_cases)
+        )
+        print(f"✅ Generated explanation ({len(explanation)} characters)\n")
+        
+        result = self._build_result(query, similar_result, timeline, similar_cases, explanation)
+        self._cache_query_result(
+            query, query_embedding, similar_result, result,
+            llm_ok=gemini_llm.failures == llm_failures
+        )
+        return result
+    
+    def process_query_stream(self, query: PatientQuery) -> Iterator[Union[str, RetrievalResult]]:
+        """
+        Streaming query processing pipeline
+        Yields the Gemini explanation in chunks as they arrive, then the
+        final RetrievalResult
+        """
+        rejected = self._validate_query(query)
+        if rejected is not None:
+            yield rejected
+            return
+        
+        self.initialize()
+        
+        similar_result, timeline, similar_cases = self._retrieve_context(query)
+        
+        # STEP 4: Generate explanation using LLM
+        print("🤖 STEP 4: GEMINI LLM - Generating Explanation")
+        print("-" * 70)
+        chunks = []
+        for chunk in gemini_llm.stream_explain_similar_cases(
+            query=query.query_text,
+            similar_cases=self._llm_case_payloads(similar_cases)
+        ):
+            chunks.append(chunk)
+            yield chunk
+        explanation = "".join(chunks)
+        print(f"✅ Generated explanation ({len(explanation)} characters)\n")
+        
+        yield self._build_result(query, similar_result, timeline, similar_cases, explanation)
+    
+    async def aprocess_query(
+        self,
+        query: PatientQuery,
+        executor: Optional[Executor] = None
+    ) -> RetrievalResult:
+        """
+        Async query processing pipeline
+        Runs retrieval and post-processing on the executor and awaits the
+        Gemini explanation natively, so no worker thread is held while the
+        LLM request is in flight
+        """
+        rejected = self._validate_query(query)
+        if rejected is not None:
+            return rejected
+        
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(executor, self.initialize)
+        
+        query_embedding, cached = await loop.run_in_executor(
+            executor, self._cached_query_result, query
+        )
+        if cached is not None:
+            return cached
+        
+        similar_result, timeline, similar_cases = await loop.run_in_executor(
+            executor, self._retrieve_context, query
+        )
+        llm_failures = gemini_llm.failures
+        
+        # STEP 4: Generate explanation using LLM
+        print("🤖 STEP 4: GEMINI LLM - Generating Explanation")
+        print("-" * 70)
+        explanation = await gemini_llm.aexplain_similar_cases(
+            query=query.query_text,
+            similar_cases=self._llm_case_payloads(similar_cases)
+        )
+        print(f"✅ Generated explanation ({len(explanation)} characters)\n")
+        
+        result = await loop.run_in_executor(
+            executor,
+            partial(self._build_result, query, similar_result, timeline, similar_cases, explanation)
+        )
+        self._cache_query_result(
+            query, query_embedding, similar_result, result,
+            llm_ok=gemini_llm.failures == llm_failures
+        )
+        return result
+    
+    def _cached_query_result(self, query: PatientQuery) -> Tuple[Optional[np.ndarray], Optional[RetrievalResult]]:
+        """
+        Look up the result of a semantically equivalent recent query
+        Returns the query embedding and a copy of the cached result (or None).
+        Hits still reinforce the records the original search retrieved
+        """
+        try:
+            query_embedding = embedding_manager.embed_query(query.query_text)
+        except Exception as e:
+            print(f"Query cache unavailable: {e}")
+            return None, None
+        
+        cached = query_result_cache.get(query.patient_id, query_embedding)
+        if cached is None:
+            return query_embedding, None
+        
+        # A close paraphrase can still ask about different topics, which
+        # changes the rule-based recommendations
+        result, retrieved_ids, topics = cached
+        if topics != recommendation_agent.detect_query_topics(query.query_text):
+            return query_embedding, None
+        
+        print("♻️ Reusing the result of an equivalent recent query")
+        qdrant_manager.record_access(retrieved_ids)
+        reasoning_steps = list(result.reasoning_steps or [])
+        if reasoning_steps:
+            reasoning_steps[0] = self._query_reasoning_step(query)
+        return query_embedding, result.model_copy(
+            update={"query": query.query_text, "reasoning_steps": reasoning_steps},
+            deep=True
+        )
+    
+    def _cache_query_result(
+        self,
+        query: PatientQuery,
+        query_embedding: Optional[np.ndarray],
+        similar_result: Dict[str, Any],
+        result: RetrievalResult,
+        llm_ok: bool = True
+    ):
+        """
+        Cache a successful query result with the records its search retrieved
+        Results built from a failed search or a mock LLM fallback are not cached
+        """
+        if query_embedding is None or not llm_ok:
+            return
+        if not similar_result.get("success") or similar_result.get("search_failed"):
+            return
+        
+        query_result_cache.set(
+            query.patient_id,
+            query_embedding,
+            (
+                result.model_copy(deep=True),
+                similar_result.get("retrieved_ids", []),
+                recommendation_agent.detect_query_topics(query.query_text)
+            )
+        )
+    
+    def _validate_query(self, query: PatientQuery) -> Optional[RetrievalResult]:
+        """Run input safety checks, returning an early result if the query is rejected"""
         print("\n" + "="*70)
         print("🏥 CARELEDGER MULTI-AGENT PIPELINE")
         print("="*70)
@@ -89,7 +268,10 @@ class CareLedgerOrchestrator:
                 safety_disclaimer=safety_agent.standard_disclaimer
             )
         print("✅ No emergency indicators detected\n")
-        
+        return None
+    
+    def _retrieve_context(self, query: PatientQuery) -> Tuple[Dict[str, Any], List[Dict[str, Any]], List[SimilarCase]]:
+        """Find similar cases and the patient's timeline"""
         # STEP 2: Find similar cases (Similarity Reasoning Agent)
         print("🔍 STEP 2: SIMILARITY REASONING AGENT - Finding Similar Cases")
         print("-" * 70)
@@ -97,7 +279,8 @@ class CareLedgerOrchestrator:
             patient_id=query.patient_id,
             query=query.query_text,
             limit=10,
-            include_old_records=True
+            include_old_records=True,
+            with_timeline=True  # Timeline comes back in the same Qdrant request
         )
         print(f"✅ Found {similar_result.get('total_found', 0)} similar records")
         print(f"   - Recent cases (< 6 months): {len(similar_result.get('recent_cases', []))}")
@@ -107,7 +290,11 @@ class CareLedgerOrchestrator:
         # STEP 3: Get temporal context (Memory Agent)
         print("🧠 STEP 3: MEMORY AGENT - Retrieving Timeline Context")
         print("-" * 70)
-        timeline = qdrant_manager.get_patient_timeline(query.patient_id)
+        timeline = similar_result.get("timeline")
+        if timeline is None:
+            # The combined search failed, so its (empty) cases are not a real answer
+            similar_result["search_failed"] = True
+            timeline = qdrant_manager.get_patient_timeline(query.patient_id)
         print(f"✅ Retrieved {len(timeline)} timeline events")
         if timeline:
             dates = [datetime.fromisoformat(t["payload"]["date"]) for t in timeline]
@@ -116,31 +303,38 @@ class CareLedgerOrchestrator:
             print(f"   - Earliest: {min(dates).strftime('%Y-%m-%d')}")
             print(f"   - Latest: {max(dates).strftime('%Y-%m-%d')}\n")
         
-        # Convert to similar case objects
-        similar_cases = []
-        for case in similar_result.get("recent_cases", []):
-            similar_cases.append(SimilarCase(**case))
-        
-        # STEP 4: Generate explanation using LLM
-        print("🤖 STEP 4: GEMINI LLM - Generating Explanation")
-        print("-" * 70)
-        explanation = gemini_llm.explain_similar_cases(
-            query=query.query_text,
-            similar_cases=[
-                {
-                    "payload": {
-                        "date": case.date.isoformat(),
-                        "record_type": case.record_type,
-                        "content": case.content,
-                        "metadata": case.metadata
-                    },
-                    "score": case.similarity_score
-                }
-                for case in similar_cases
-            ]
-        )
-        print(f"✅ Generated explanation ({len(explanation)} characters)\n")
+        # Convert to similar case objects (already typed by the similarity agent, so skip validation)
+        similar_cases = [
+            SimilarCase.model_construct(**case)
+            for case in similar_result.get("recent_cases", [])
+        ]
         
+        return similar_result, timeline, similar_cases
+    
+    def _llm_case_payloads(self, similar_cases: List[SimilarCase]) -> List[Dict[str, Any]]:
+        """Shape similar cases as search results for the LLM prompt"""
+        return [
+            {
+                "payload": {
+                    "date": case.date.isoformat(),
+                    "record_type": case.record_type,
+                    "content": case.content,
+                    "metadata": case.metadata
+                },
+                "score": case.similarity_score
+            }
+            for case in similar_cases
+        ]
+    
+    def _build_result(
+        self,
+        query: PatientQuery,
+        similar_result: Dict[str, Any],
+        timeline: List[Dict[str, Any]],
+        similar_cases: List[SimilarCase],
+        explanation: str
+    ) -> RetrievalResult:
+        """Generate recommendations, validate output and assemble the evidence trace"""
         # STEP 5: Generate recommendations (Recommendation Agent)
         print("💡 STEP 5: RECOMMENDATION AGENT - Generating Suggestions")
         print("-" * 70)
@@ -204,7 +398,7 @@ class CareLedgerOrchestrator:
         
         # Document reasoning steps
         reasoning_steps = [
-            f"1. Query analyzed: '{query.query_text}'",
+            self._query_reasoning_step(query),
             f"2. Searched {len(timeline)} patient records in vector database",
             f"3. Found {len(similar_cases)} semantically similar cases using cosine similarity",
             f"4. Applied time-weighted ranking (recent records boosted)",
@@ -249,6 +443,10 @@ class CareLedgerOrchestrator:
         
         return result
     
+    def _query_reasoning_step(self, query: PatientQuery) -> str:
+        """First reasoning step, the only one that quotes the query"""
+        return f"1. Query analyzed: '{query.query_text}'"
+    
     def _explain_why_record_matters(self, case: SimilarCase, query: str) -> str:
         """Explain why a specific record is relevant to the query"""
         reasons = []
@@ -282,8 +480,6 @@ class CareLedgerOrchestrator:
     
     def ingest_record(self, request: IngestionRequest) -> Dict[str, Any]:
         """Ingest a new medical record"""
-        self.initialize()
-        
         # Validate patient ID
         patient_validation = safety_agent.validate_patient_id(request.patient_id)
         if not patient_validation["valid"]:
@@ -292,62 +488,72 @@ class CareLedgerOrchestrator:
                 "error": patient_validation["error"]
             }
         
-        # Use Ingestion Agent
-        result = ingestion_agent.ingest_record(request)
+        self.initialize()
+        
+        # Use Ingestion Agent (it clears the patient's cached answers)
+        return ingestion_agent.ingest_record(request)
+    
+    def batch_ingest(self, requests: List[IngestionRequest]) -> Dict[str, Any]:
+        """Ingest several medical records with one batched embedding pass"""
+        # Validate patient IDs; invalid requests fail individually
+        valid_requests = []
+        failed = []
+        for request in requests:
+            patient_validation = safety_agent.validate_patient_id(request.patient_id)
+            if patient_validation["valid"]:
+                valid_requests.append(request)
+            else:
+                failed.append({
+                    "success": False,
+                    "error": patient_validation["error"]
+                })
+        
+        if valid_requests:
+            self.initialize()
+        
+        # Use Ingestion Agent (it clears the patients' cached answers)
+        result = ingestion_agent.batch_ingest(valid_requests)
+        
+        result["results"]["failed"].extend(failed)
+        result["total"] = len(requests)
+        result["failed_count"] += len(failed)
         
         return result
     
     def get_patient_timeline(self, patient_id: str) -> PatientTimeline:
         """Get patient's complete timeline"""
+        return self.get_patient_timeline_columnar(patient_id).to_timeline()
+    
+    def get_patient_timeline_columnar(self, patient_id: str) -> PatientTimelineColumnar:
+        """Get patient's complete timeline as columns for vectorized date filtering"""
         self.initialize()
         
         # Validate patient ID
         patient_validation = safety_agent.validate_patient_id(patient_id)
-        if not patient_validation["valid"]:
-            return PatientTimeline(
-                patient_id=patient_id,
-                events=[],
-                total_records=0,
-                date_range={}
-            )
-        
-        # Get timeline from vector store
-        timeline_records = qdrant_manager.get_patient_timeline(patient_id)
-        
-        # Convert to timeline events
-        events = []
-        for record in timeline_records:
-            payload = record["payload"]
-            event = TimelineEvent(
-                date=datetime.fromisoformat(payload["date"]),
-                event_type=payload.get("record_type", "unknown"),
-                title=self._generate_event_title(payload),
-                description=payload.get("content", "")[:200],
-                record_id=payload.get("record_id", record["id"]),
-                metadata=payload.get("metadata", {})
-            )
-            events.append(event)
-        
-        # Sort by date
-        events.sort(key=lambda x: x.date)
-        
-        # Create timeline
-        if events:
-            date_range = {
-                "earliest": events[0].date,
-                "latest": events[-1].date
-            }
+        if patient_validation["valid"]:
+            # Get timeline from vector store (already chronological)
+            timeline = qdrant_manager.get_patient_timeline_columnar(patient_id)
         else:
-            date_range = {}
+            timeline = {"id": [], "date": np.array([], dtype="datetime64[us]"), "payload": []}
+        
+        payloads = timeline["payload"]
+        event_types = [payload.get("record_type", "unknown") for payload in payloads]
+        modalities = [payload.get("modality", "text") for payload in payloads]
         
-        timeline = PatientTimeline(
+        return PatientTimelineColumnar(
             patient_id=patient_id,
-            events=events,
-            total_records=len(events),
-            date_range=date_range
+            dates=timeline["date"],
+            event_types=_object_column(event_types),
+            titles=_object_column([self._generate_event_title(payload) for payload in payloads]),
+            descriptions=_object_column([payload.get("content", "")[:200] for payload in payloads]),
+            record_ids=_object_column([
+                payload.get("record_id", point_id)
+                for payload, point_id in zip(payloads, timeline["id"])
+            ]),
+            metadatas=_object_column([intern_strings(payload.get("metadata", {})) for payload in payloads]),
+            record_type_codes=encode_column(event_types, RECORD_TYPE_CODES),
+            modality_codes=encode_column(modalities, MODALITY_CODES)
         )
-        
-        return timeline
     
     def _generate_event_title(self, payload: Dict[str, Any]) -> str:
         """Generate a title for a timeline event"""
@@ -383,6 +589,9 @@ class CareLedgerOrchestrator:
         """Apply memory maintenance (temporal decay, etc.)"""
         self.initialize()
         
+        # Decay changes memory weights and so the ranking of cached results
+        query_result_cache.invalidate(patient_id)
+        
         return memory_agent.apply_memory_maintenance(patient_id)
     
     def analyze_symptom_progression(
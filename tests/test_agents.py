@@ -65,6 +65,136 @@ class TestIngestionAgent:
             # Expected if Qdrant not initialized
             pass
 
+    def test_batch_ingest_reports_invalid_requests(self):
+        """Test that invalid requests fail individually in a batch"""
+        requests = [
+            IngestionRequest(
+                patient_id="test_001",
+                record_type=RecordType.SCAN,
+                modality=Modality.IMAGE,
+                content="Chest X-ray without a file"
+            )
+        ]
+
+        result = ingestion_agent.batch_ingest(requests)
+
+        assert result["total"] == 1
+        assert result["failed_count"] == 1
+        assert "file path" in result["results"]["failed"][0]["error"].lower()
+
+    def test_batch_ingest_isolates_failing_records(self, monkeypatch):
+        """Test that one record failing to embed does not fail the whole batch"""
+        import numpy as np
+        from utils.embeddings import embedding_manager
+        from utils.vector_store import qdrant_manager
+
+        def embed_medical_texts(texts, contexts=None):
+            if any("unreadable" in text for text in texts):
+                raise ValueError("Could not embed record")
+            return np.ones((len(texts), 384), dtype=np.float32)
+
+        monkeypatch.setattr(embedding_manager, "embed_medical_texts", embed_medical_texts)
+        qdrant_manager.initialize()
+        requests = [
+            IngestionRequest(
+                patient_id="test_001",
+                record_type=RecordType.SYMPTOM,
+                modality=Modality.TEXT,
+                content=content,
+                metadata={"date": datetime.now()}
+            )
+            for content in ["Mild headache", "unreadable record"]
+        ]
+
+        result = ingestion_agent.batch_ingest(requests)
+
+        assert result["success_count"] == 1
+        assert result["failed_count"] == 1
+        assert "could not embed" in result["results"]["failed"][0]["error"].lower()
+
+    def test_batch_ingest_retry_does_not_duplicate_written_chunks(self, monkeypatch):
+        """Test that retrying a partly written batch leaves one copy of each record"""
+        import numpy as np
+        from utils.embeddings import embedding_manager
+        from utils.vector_store import qdrant_manager
+
+        monkeypatch.setattr(
+            embedding_manager, "embed_medical_texts",
+            lambda texts, contexts=None: np.ones((len(texts), 384), dtype=np.float32)
+        )
+        qdrant_manager.initialize()
+        upsert = qdrant_manager.client.upsert
+        calls = []
+
+        def fail_second_chunk(*args, **kwargs):
+            calls.append(1)
+            if len(calls) == 2:
+                raise ConnectionError("Upsert interrupted")
+            return upsert(*args, **kwargs)
+
+        monkeypatch.setattr(qdrant_manager.client, "upsert", fail_second_chunk)
+        requests = [
+            IngestionRequest(
+                patient_id="chunked_001",
+                record_type=RecordType.SYMPTOM,
+                modality=Modality.TEXT,
+                content=f"Symptom note {i}",
+                metadata={"date": datetime.now()}
+            )
+            for i in range(70)  # Two upsert chunks of 64
+        ]
+
+        result = ingestion_agent.batch_ingest(requests)
+
+        assert result["success_count"] == 70
+        assert len(qdrant_manager.get_patient_timeline("chunked_001")) == 70
+
+    def test_async_batch_ingest_clears_patient_caches(self, monkeypatch):
+        """Test that ingesting through the agent directly drops stale cached answers"""
+        import asyncio
+        import numpy as np
+        from utils.embeddings import embedding_manager
+        from utils.vector_store import qdrant_manager
+        from utils.cache import query_result_cache, unfollowed_index_cache
+
+        monkeypatch.setattr(
+            embedding_manager, "embed_medical_texts",
+            lambda texts, contexts=None: np.ones((len(texts), 384), dtype=np.float32)
+        )
+        qdrant_manager.initialize()
+        query_result_cache.set("stale_001", np.ones(384, dtype=np.float32), "cached answer")
+        unfollowed_index_cache.set("stale_001", {})
+        request = IngestionRequest(
+            patient_id="stale_001",
+            record_type=RecordType.SYMPTOM,
+            modality=Modality.TEXT,
+            content="New symptom note",
+            metadata={"date": datetime.now()}
+        )
+
+        result = asyncio.run(ingestion_agent.abatch_ingest([request]))
+
+        assert result["success_count"] == 1
+        assert query_result_cache.get("stale_001", np.ones(384, dtype=np.float32)) is None
+        assert unfollowed_index_cache.get("stale_001") is None
+
+    def test_parallel_batch_ingest_falls_back_in_memory(self):
+        """Test that multi-worker ingestion runs in-process for in-memory Qdrant"""
+        requests = [
+            IngestionRequest(
+                patient_id=f"test_00{i}",
+                record_type=RecordType.SCAN,
+                modality=Modality.IMAGE,
+                content="Chest X-ray without a file"
+            )
+            for i in range(2)
+        ]
+
+        result = ingestion_agent.batch_ingest(requests, n_workers=2)
+
+        assert result["total"] == 2
+        assert result["failed_count"] == 2
+
 
 class TestMemoryAgent:
     """Test suite for Memory Agent"""
@@ -107,6 +237,28 @@ class TestSimilarityAgent:
             # Expected if no data exists
             pass
 
+    
+    def test_forgotten_patterns_use_unfollowed_index(self):
+        """Test that unfollowed recommendations come from the precomputed index"""
+        now = datetime(2024, 6, 1)
+        old_cases = [{
+            "record_id": "rec_001",
+            "record_type": RecordType.DOCTOR_NOTE,
+            "date": datetime(2023, 9, 1),
+            "similarity_score": 0.65,
+            "metadata": {"unfollowed_recommendation": "physical therapy"}
+        }]
+        
+        indexed = similarity_agent._identify_forgotten_patterns(
+            "neck pain", old_cases, [], now, unfollowed={"rec_001": "physical therapy"}
+        )
+        unindexed = similarity_agent._identify_forgotten_patterns(
+            "neck pain", old_cases, [], now, unfollowed={}
+        )
+        
+        assert any("physical therapy" in insight for insight in indexed)
+        assert indexed == similarity_agent._identify_forgotten_patterns("neck pain", old_cases, [], now)
+        assert not any("physical therapy" in insight for insight in unindexed)
 
 class TestSafetyAgent:
     """Test suite for Safety & Ethics Agent"""
@@ -201,6 +353,58 @@ class TestRecommendationAgent:
         assert "success" in result
         assert "recommendations" in result
 
+    def test_llm_recommendations_are_cached(self, monkeypatch):
+        """Test that an identical query and history reuses the LLM response"""
+        from utils.llm import gemini_llm
+        from utils.cache import llm_recommendation_cache
+
+        calls = []
+        def model_response(prompt, temperature):
+            calls.append(prompt)
+            return '["Track your symptoms"]'
+        monkeypatch.setattr(gemini_llm, "_model_response", model_response)
+
+        timeline = [{"payload": {"date": "2024-01-01", "record_type": "symptom", "content": "Headache"}}]
+        first = gemini_llm.generate_recommendations("cache test query", timeline)
+        second = gemini_llm.generate_recommendations("cache test query", timeline)
+
+        assert first == second == ["Track your symptoms"]
+        assert len(calls) == 1
+        llm_recommendation_cache.clear()
+
+    def test_llm_fallback_recommendations_are_not_cached(self, monkeypatch):
+        """Test that the mock fallback after a model failure is not cached"""
+        from utils.llm import gemini_llm
+        from utils.cache import llm_recommendation_cache
+
+        monkeypatch.setattr(gemini_llm, "_model_response", lambda prompt, temperature: None)
+
+        cached_entries = len(llm_recommendation_cache)
+        recommendations = gemini_llm.generate_recommendations("fallback test query", [])
+
+        assert recommendations
+        assert len(llm_recommendation_cache) == cached_entries
+
+
+    def test_llm_stream_failures_are_counted(self, monkeypatch):
+        """Test that a failed stream is counted like any other model failure"""
+        import dataclasses
+        import utils.llm as llm_module
+        from utils.llm import gemini_llm
+
+        class FailingModel:
+            def generate_content(self, *args, **kwargs):
+                raise ConnectionError("Stream interrupted")
+
+        monkeypatch.setattr(llm_module, "settings", dataclasses.replace(llm_module.settings, GEMINI_API_KEY="test-key"))
+        monkeypatch.setattr(gemini_llm, "initialized", True)
+        monkeypatch.setattr(gemini_llm, "model", FailingModel())
+
+        failures = gemini_llm.failures
+        chunks = list(gemini_llm.stream_response("stream failure test"))
+
+        assert "".join(chunks)
+        assert gemini_llm.failures == failures + 1
 
 class TestAgentIntegration:
     """Integration tests for agent coordination"""
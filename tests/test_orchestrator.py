@@ -2,6 +2,9 @@
 Unit tests for CareLedger orchestrator
 """
 import pytest
+import asyncio
+import numpy as np
+from datetime import datetime
 import sys
 import os
 
@@ -9,7 +12,11 @@ import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from orchestrator import orchestrator
-from models.schemas import PatientQuery, IngestionRequest, RecordType, Modality
+from utils.embeddings import embedding_manager
+from models.schemas import (
+    PatientQuery, RetrievalResult, IngestionRequest, RecordType, Modality, PatientTimelineColumnar,
+    RECORD_TYPE_CODES, MODALITY_CODES, encode_column, RecordMetadata
+)
 
 
 class TestOrchestrator:
@@ -85,6 +92,114 @@ class TestOrchestrator:
             # Expected if Qdrant not initialized
             pass
     
+    def test_timeline_columnar_window(self):
+        """Test vectorized date-window filtering before materializing events"""
+        dates = np.array(["2024-01-01", "2024-02-01", "2024-03-01"], dtype="datetime64[us]")
+        columns = np.array(["a", "b", "c"], dtype=object)
+        timeline = PatientTimelineColumnar(
+            patient_id="test_001",
+            dates=dates,
+            event_types=columns,
+            titles=columns,
+            descriptions=columns,
+            record_ids=columns,
+            metadatas=np.array([{}, {}, {}], dtype=object),
+            record_type_codes=encode_column(["symptom", "scan", "symptom"], RECORD_TYPE_CODES),
+            modality_codes=encode_column(["text", "image", "text"], MODALITY_CODES)
+        )
+        
+        window = timeline.filter_by_window(datetime(2024, 1, 15), datetime(2024, 3, 1)).to_timeline()
+        
+        assert window.total_records == 2
+        assert [event.record_id for event in window.events] == ["b", "c"]
+        assert window.date_range["earliest"] == datetime(2024, 2, 1)
+        
+        symptoms = timeline.filter_types(record_types=[RecordType.SYMPTOM])
+        assert list(symptoms.record_ids) == ["a", "c"]
+        assert list(symptoms.filter_types(modalities=[Modality.IMAGE]).record_ids) == []
+    
+    def test_orjson_model_round_trip(self):
+        """Test that orjson-encoded models parse back unchanged"""
+        request = IngestionRequest(
+            patient_id="test_001",
+            record_type=RecordType.SYMPTOM,
+            modality=Modality.TEXT,
+            content="Test",
+            metadata={"date": datetime(2024, 1, 1, 8, 30)}
+        )
+        
+        encoded = request.model_dump_json()
+        
+        assert '"date":"2024-01-01T08:30:00"' in encoded
+        assert IngestionRequest.model_validate_json(encoded).record_type == RecordType.SYMPTOM
+    
+    def test_metadata_strings_are_interned(self):
+        """Test that repeated metadata values share one string object"""
+        requests = [
+            IngestionRequest(
+                patient_id="test_001",
+                record_type=RecordType.SYMPTOM,
+                modality=Modality.TEXT,
+                content="Test",
+                metadata={"symptoms": ["".join(["mig", "raine"])]}
+            )
+            for _ in range(2)
+        ]
+        
+        assert requests[0].metadata["symptoms"][0] is requests[1].metadata["symptoms"][0]
+    
+    def test_record_metadata_becomes_plain_dict(self):
+        """Test that typed metadata is stored on requests as a plain dict"""
+        metadata = {"symptoms": ["headache"], "severity": "mild"}
+        typed = RecordMetadata.from_dict(metadata)
+        
+        request = IngestionRequest(
+            patient_id="test_001",
+            record_type=RecordType.SYMPTOM,
+            modality=Modality.TEXT,
+            content="Test",
+            metadata=typed
+        )
+        
+        assert typed.symptoms == ("headache",)
+        assert request.metadata == metadata
+    
+    def test_query_cache_skips_failed_results(self, monkeypatch):
+        """Test that failed results are not cached and hits echo the new query"""
+        import orchestrator as orchestrator_module
+        from utils.cache import query_result_cache
+
+        embedding = np.ones(384, dtype=np.float32)
+        monkeypatch.setattr(orchestrator_module.embedding_manager, "embed_query", lambda text: embedding)
+        monkeypatch.setattr(orchestrator_module.qdrant_manager, "record_access", lambda ids: None)
+        query_result_cache.invalidate("cache_001")
+
+        query = PatientQuery(patient_id="cache_001", query_text="headache at night")
+        result = RetrievalResult(
+            query=query.query_text,
+            similar_cases=[],
+            temporal_context=[],
+            forgotten_insights=[],
+            recommendations=[],
+            safety_disclaimer="",
+            reasoning_steps=[orchestrator._query_reasoning_step(query)]
+        )
+
+        orchestrator._cache_query_result(query, embedding, {"success": True, "search_failed": True}, result)
+        orchestrator._cache_query_result(query, embedding, {"success": True}, result, llm_ok=False)
+        assert orchestrator._cached_query_result(query)[1] is None
+
+        orchestrator._cache_query_result(query, embedding, {"success": True}, result)
+        rephrased = PatientQuery(patient_id="cache_001", query_text="headaches during the night")
+        cached = orchestrator._cached_query_result(rephrased)[1]
+        assert cached.query == rephrased.query_text
+        assert rephrased.query_text in cached.reasoning_steps[0]
+
+        # Same embedding, but a different topic needs its own recommendations
+        other_topic = PatientQuery(patient_id="cache_001", query_text="headache medication at night")
+        assert orchestrator._cached_query_result(other_topic)[1] is None
+        query_result_cache.invalidate("cache_001")
+    
     def test_get_memory_summary(self):
         """Test getting memory summary"""
         result = orchestrator.get_memory_summary("test_001")
@@ -107,6 +222,36 @@ class TestOrchestrator:
             
         except Exception:
             pass
+
+    def test_async_process_query_emergency(self):
+        """Test that the async pipeline applies the same emergency check"""
+        query = PatientQuery(
+            patient_id="test_001",
+            query_text="I can't breathe and having chest pain"
+        )
+
+        result = asyncio.run(orchestrator.aprocess_query(query))
+
+        assert len(result.recommendations) > 0
+        assert result.similar_cases == []
+
+    def test_process_query_stream_ends_with_result(self):
+        """Test that the streaming pipeline yields text chunks, then the result"""
+        query = PatientQuery(
+            patient_id="test_001",
+            query_text="Have I had headaches like this before?"
+        )
+        
+        try:
+            embedding_manager.initialize()
+        except Exception as e:
+            pytest.skip(f"Embedding model unavailable: {e}")
+        
+        chunks = list(orchestrator.process_query_stream(query))
+        
+        assert hasattr(chunks[-1], 'recommendations')
+        assert len(chunks) > 1
+        assert all(isinstance(chunk, str) for chunk in chunks[:-1])
     
     def test_invalid_patient_id(self):
         """Test handling of invalid patient ID"""
@@ -120,6 +265,21 @@ class TestOrchestrator:
         result = orchestrator.ingest_record(request)
         assert result["success"] is False
     
+    def test_batch_ingest_invalid_patient_id(self):
+        """Test that invalid patient IDs fail individually in a batch"""
+        request = IngestionRequest(
+            patient_id="invalid@#$",
+            record_type=RecordType.SYMPTOM,
+            modality=Modality.TEXT,
+            content="Test"
+        )
+        
+        result = orchestrator.batch_ingest([request])
+        
+        assert result["total"] == 1
+        assert result["failed_count"] == 1
+        assert result["success_count"] == 0
+    
     def test_get_consent_notice(self):
         """Test consent notice retrieval"""
         notice = orchestrator.get_consent_notice()
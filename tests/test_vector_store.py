@@ -12,6 +12,7 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 
 from utils.vector_store import qdrant_manager
 from utils.embeddings import embedding_manager
+from utils.cache import ContentCache, SemanticCache, content_key
 
 
 class TestEmbeddingManager:
@@ -51,7 +52,19 @@ class TestEmbeddingManager:
             
         except Exception:
             pass
-    
+
+    def test_embed_query_is_cached(self):
+        """Test that repeated queries reuse the cached embedding"""
+        try:
+            embedding_manager.initialize()
+        except Exception as e:
+            pytest.skip(f"Embedding model unavailable: {e}")
+
+        first = embedding_manager.embed_query("Recurring headaches")
+        second = embedding_manager.embed_query("Recurring headaches")
+
+        assert second is first
+
     def test_get_embedding_dimension(self):
         """Test getting embedding dimensions"""
         text_dim = embedding_manager.get_embedding_dimension("text")
@@ -124,6 +137,25 @@ class TestQdrantManager:
         except Exception:
             pass
     
+    def test_search_similar_with_timeline(self):
+        """Test batched similarity search and timeline fetch"""
+        try:
+            embedding_manager.initialize()
+        except Exception as e:
+            pytest.skip(f"Embedding model unavailable: {e}")
+        
+        qdrant_manager.initialize()
+        query_embedding = embedding_manager.embed_text("headache symptoms")
+        
+        similar, timeline = qdrant_manager.search_similar_with_timeline(
+            query_embedding=query_embedding,
+            patient_id="test_001",
+            limit=5
+        )
+        
+        assert isinstance(similar, list)
+        assert timeline == qdrant_manager.get_patient_timeline("test_001")
+    
     def test_get_patient_timeline(self):
         """Test getting patient timeline"""
         try:
@@ -132,10 +164,19 @@ class TestQdrantManager:
             timeline = qdrant_manager.get_patient_timeline("test_001")
             
             assert isinstance(timeline, list)
-            
+
         except Exception:
             pass
-    
+
+    def test_get_patient_timeline_columnar(self):
+        """Test getting patient timeline as aligned columns"""
+        qdrant_manager.initialize()
+
+        timeline = qdrant_manager.get_patient_timeline_columnar("test_001")
+
+        assert timeline["date"].dtype == np.dtype("datetime64[us]")
+        assert len(timeline["date"]) == len(timeline["record_type"]) == len(timeline["payload"])
+
     def test_memory_evolution_fields(self):
         """Test that memory evolution fields are properly set"""
         try:
@@ -211,6 +252,62 @@ class TestMemoryEvolution:
             pass
 
 
+class TestContentCache:
+    """Test suite for content-hash caching"""
+    
+    def test_content_key_is_stable(self):
+        """Test that identical content maps to the same key"""
+        assert content_key("model", "headache") == content_key("model", "headache")
+        assert content_key("model", "headache") != content_key("model", "migraine")
+        assert content_key("ab", "c") != content_key("a", "bc")
+    
+    def test_cache_hit_and_miss(self):
+        """Test cache lookups"""
+        cache = ContentCache(max_entries=4)
+        key = content_key("Test record")
+        
+        assert cache.get(key) is None
+        cache.set(key, "cached text")
+        assert cache.get(key) == "cached text"
+    
+    def test_cache_evicts_least_recently_used(self):
+        """Test that the cache stays bounded"""
+        cache = ContentCache(max_entries=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        
+        assert len(cache) == 2
+        assert cache.get("a") == 1
+        assert cache.get("b") is None
+
+    def test_cache_expires_and_deletes_entries(self):
+        """Test TTL expiry and explicit invalidation"""
+        expired = ContentCache(max_entries=2, ttl=0)
+        expired.set("a", 1)
+        assert expired.get("a") is None
+
+        cache = ContentCache(max_entries=2, ttl=30)
+        cache.set("a", 1)
+        assert cache.get("a") == 1
+        cache.delete("a")
+        cache.delete("missing")
+        assert cache.get("a") is None
+
+    def test_semantic_cache_matches_similar_embeddings(self):
+        """Test that lookups match by cosine similarity within a namespace"""
+        cache = SemanticCache(max_entries=2, threshold=0.95)
+        cache.set("patient_a", np.array([1.0, 0.0, 0.0]), "headache result")
+        
+        assert cache.get("patient_a", np.array([2.0, 0.01, 0.0])) == "headache result"
+        assert cache.get("patient_a", np.array([0.0, 1.0, 0.0])) is None
+        assert cache.get("patient_b", np.array([1.0, 0.0, 0.0])) is None
+        
+        cache.invalidate("patient_a")
+        assert cache.get("patient_a", np.array([1.0, 0.0, 0.0])) is None
+
+
 class TestVectorOperations:
     """Test suite for vector operations"""
     
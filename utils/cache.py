@@ -0,0 +1,142 @@
+"""
+Content-hash caches
+Lets repeated ingestion, queries and patient reads skip expensive work
+"""
+from collections import OrderedDict
+from typing import Any, Optional, Union
+import hashlib
+import threading
+import time
+import numpy as np
+
+def content_key(*parts: Union[str, bytes]) -> str:
+    """Build a cache key from the BLAKE2b hash of the given parts"""
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode("utf-8")
+        digest.update(part)
+        digest.update(b"\0")  # Separator so ("ab", "c") != ("a", "bc")
+    return digest.hexdigest()
+
+def file_key(file_path: str, chunk_size: int = 1 << 20) -> str:
+    """Build a cache key from the BLAKE2b hash of a file's bytes"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class ContentCache:
+    """Bounded, thread-safe LRU cache keyed by content hash"""
+
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl  # Seconds before an entry expires, None to keep until evicted
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value for key, or None on a miss"""
+        with self._lock:
+            if key not in self._entries:
+                return None
+            expires_at, value = self._entries[key]
+            if expires_at is not None and time.monotonic() >= expires_at:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any):
+        """Cache a value, evicting the least recently used entry when full"""
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str):
+        """Remove a cached entry if present"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """Remove all cached entries"""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+class SemanticCache:
+    """
+    Bounded, thread-safe cache matched by embedding similarity
+    Entries are grouped by namespace (e.g. patient) and a lookup returns the
+    entry whose embedding is most cosine-similar, if above the threshold
+    """
+
+    def __init__(self, max_entries: int = 32, ttl: Optional[float] = None, threshold: float = 0.95):
+        self.max_entries = max_entries  # Per namespace
+        self.ttl = ttl  # Seconds before an entry expires, None to keep until evicted
+        self.threshold = threshold
+        self._namespaces = {}
+        self._lock = threading.Lock()
+
+    def get(self, namespace: str, embedding: np.ndarray) -> Optional[Any]:
+        """Return the value cached for the most similar embedding, or None on a miss"""
+        with self._lock:
+            entries = self._namespaces.get(namespace)
+            if not entries:
+                return None
+            now = time.monotonic()
+            entries[:] = [entry for entry in entries if entry[0] is None or now < entry[0]]
+            if not entries:
+                return None
+            
+            # One matrix-vector product scores every cached query
+            similarities = np.stack([entry[1] for entry in entries]) @ self._normalize(embedding)
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                return None
+            
+            entries.append(entries.pop(best))  # Most recently used last
+            return entries[-1][2]
+
+    def set(self, namespace: str, embedding: np.ndarray, value: Any):
+        """Cache a value, evicting the namespace's least recently used entry when full"""
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            entries = self._namespaces.setdefault(namespace, [])
+            entries.append((expires_at, self._normalize(embedding), value))
+            if len(entries) > self.max_entries:
+                entries.pop(0)
+
+    def invalidate(self, namespace: str):
+        """Remove all entries of a namespace"""
+        with self._lock:
+            self._namespaces.pop(namespace, None)
+
+    def clear(self):
+        """Remove all cached entries"""
+        with self._lock:
+            self._namespaces.clear()
+
+    def __len__(self) -> int:
+        return sum(len(entries) for entries in self._namespaces.values())
+
+    @staticmethod
+    def _normalize(embedding: np.ndarray) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+# Global instances
+pdf_text_cache = ContentCache(max_entries=256)
+embedding_cache = ContentCache(max_entries=4096)
+llm_recommendation_cache = ContentCache(max_entries=512)
+timeline_cache = ContentCache(max_entries=1024, ttl=30)
+memory_summary_cache = ContentCache(max_entries=1024, ttl=30)
+query_result_cache = SemanticCache(max_entries=32, ttl=300, threshold=0.95)
+unfollowed_index_cache = ContentCache(max_entries=1024, ttl=300)
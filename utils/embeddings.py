@@ -1,13 +1,13 @@
 """
 Embedding utilities for multimodal medical data
 """
-from sentence_transformers import SentenceTransformer
 from PIL import Image
-import torch
 import numpy as np
-from typing import List, Union
+from typing import List, Optional, Union
 import io
 import base64
+from config import settings
+from utils.cache import embedding_cache, content_key
 
 class EmbeddingManager:
     """Manages embeddings for different modalities"""
@@ -19,8 +19,11 @@ class EmbeddingManager:
     def initialize(self):
         """Lazy initialization of models"""
         if not self.initialized:
+            # Imported here so importing this module doesn't load torch
+            from sentence_transformers import SentenceTransformer
+            
             print("Loading embedding models...")
-            self.text_model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
+            self.text_model = SentenceTransformer(settings.TEXT_EMBEDDING_MODEL)
             self.initialized = True
             print("Models loaded successfully")
     
@@ -34,6 +37,19 @@ class EmbeddingManager:
         embeddings = self.text_model.encode(texts, convert_to_numpy=True)
         return embeddings
     
+    def embed_query(self, query: str) -> np.ndarray:
+        """
+        Generate the embedding for a search query
+        Repeated queries reuse the cached embedding instead of re-running the model
+        """
+        cache_key = content_key(settings.TEXT_EMBEDDING_MODEL, "query", query)
+        embedding = embedding_cache.get(cache_key)
+        if embedding is None:
+            embedding = self.embed_text(query)
+            embedding_cache.set(cache_key, embedding)
+        
+        return embedding
+    
     def embed_medical_text(self, text: str, context: dict = None) -> np.ndarray:
         """
         Generate embeddings for medical text with context
@@ -41,7 +57,62 @@ class EmbeddingManager:
         """
         self.initialize()
         
-        # Enhance text with context for better similarity matching
+        enhanced_text = self._enhance_with_context(text, context)
+        
+        # Reuse the embedding of identical text from the same model
+        cache_key = content_key(settings.TEXT_EMBEDDING_MODEL, enhanced_text)
+        embedding = embedding_cache.get(cache_key)
+        if embedding is None:
+            embedding = self.text_model.encode(enhanced_text, convert_to_numpy=True)
+            embedding_cache.set(cache_key, embedding)
+        
+        return embedding
+    
+    def embed_medical_texts(
+        self,
+        texts: List[str],
+        contexts: List[Optional[dict]] = None,
+        batch_size: int = 32
+    ) -> np.ndarray:
+        """
+        Generate embeddings for many medical texts in one model call
+        Returns an array of shape (len(texts), dim), row-aligned with texts
+        """
+        self.initialize()
+        
+        if contexts is None:
+            contexts = [None] * len(texts)
+        
+        enhanced_texts = [
+            self._enhance_with_context(text, context)
+            for text, context in zip(texts, contexts)
+        ]
+        cache_keys = [
+            content_key(settings.TEXT_EMBEDDING_MODEL, text) for text in enhanced_texts
+        ]
+        embeddings = [embedding_cache.get(key) for key in cache_keys]
+        
+        # Only send cache misses to the model, still in a single call
+        misses = {}
+        for i, key in enumerate(cache_keys):
+            if embeddings[i] is None:
+                misses.setdefault(key, []).append(i)
+        
+        if misses:
+            miss_embeddings = self.text_model.encode(
+                [enhanced_texts[indices[0]] for indices in misses.values()],
+                batch_size=batch_size,
+                convert_to_numpy=True
+            )
+            for (key, indices), embedding in zip(misses.items(), miss_embeddings):
+                embedding_cache.set(key, embedding)
+                for i in indices:
+                    embeddings[i] = embedding
+        
+        return np.array(embeddings)
+    
+    def _enhance_with_context(self, text: str, context: Optional[dict]) -> str:
+        """Enhance text with context for better similarity matching"""
         enhanced_text = text
         if context:
             if context.get('symptoms'):
@@ -50,9 +121,7 @@ class EmbeddingManager:
                 enhanced_text += f" Diagnosis: {context['diagnosis']}"
             if context.get('medications'):
                 enhanced_text += f" Medications: {', '.join(context['medications'])}"
-        
-        embedding = self.text_model.encode(enhanced_text, convert_to_numpy=True)
-        return embedding
+        return enhanced_text
     
     def embed_image(self, image_path: str) -> np.ndarray:
         """
@@ -62,11 +131,11 @@ class EmbeddingManager:
         try:
             # For demo purposes, create a dummy embedding
             # In production, use CLIP or MedCLIP
-            img = Image.open(image_path)
             
             # Simple feature extraction (placeholder)
-            # Convert to grayscale and resize
-            img_gray = img.convert('L').resize((224, 224))
+            # Convert to grayscale and resize, closing the full-size image early
+            with Image.open(image_path) as img:
+                img_gray = img.convert('L').resize((224, 224))
             img_array = np.array(img_gray)
             
             # Create a simple feature vector (in production, use proper CNN)
@@ -3,9 +3,11 @@ Gemini LLM Integration
 Handles all interactions with Google's Gemini API
 """
 import google.generativeai as genai
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Iterator
 from config import settings
+from utils.cache import llm_recommendation_cache, content_key
 import json
+import threading
 
 class GeminiLLM:
     """Wrapper for Gemini LLM operations"""
@@ -14,6 +16,8 @@ class GeminiLLM:
         self.model = None
         self.vision_model = None
         self.initialized = False
+        self.failures = 0  # Model calls that errored and fell back to mock text
+        self._failures_lock = threading.Lock()
         
     def initialize(self):
         """Initialize Gemini API"""
@@ -35,30 +39,116 @@ class GeminiLLM:
     
     def generate_response(self, prompt: str, temperature: float = 0.7) -> str:
         """Generate a response from Gemini"""
+        response = self._model_response(prompt, temperature)
+        if response is None:
+            return self._mock_response(prompt)
+        return response
+    
+    def _model_response(self, prompt: str, temperature: float) -> Optional[str]:
+        """Gemini's response text, or None when the model is unavailable or errored"""
         self.initialize()
         
         if not settings.GEMINI_API_KEY or not self.model:
-            return self._mock_response(prompt)
+            return None
         
         try:
             response = self.model.generate_content(
                 prompt,
-                generation_config=genai.types.GenerationConfig(
-                    temperature=temperature,
-                    max_output_tokens=1024,
-                )
+                generation_config=self._generation_config(temperature)
             )
             return response.text
         except Exception as e:
             print(f"Error generating response: {e}")
+            self._record_failure()
+            return None
+    
+    async def agenerate_response(self, prompt: str, temperature: float = 0.7) -> str:
+        """Generate a response from Gemini without blocking the event loop"""
+        self.initialize()
+        
+        if not settings.GEMINI_API_KEY or not self.model:
+            return self._mock_response(prompt)
+        
+        try:
+            response = await self.model.generate_content_async(
+                prompt,
+                generation_config=self._generation_config(temperature)
+            )
+            return response.text
+        except Exception as e:
+            print(f"Error generating response: {e}")
+            self._record_failure()
             return self._mock_response(prompt)
     
+    def stream_response(self, prompt: str, temperature: float = 0.7) -> Iterator[str]:
+        """Generate a response from Gemini, yielding text as it arrives"""
+        self.initialize()
+        
+        if not settings.GEMINI_API_KEY or not self.model:
+            yield self._mock_response(prompt)
+            return
+        
+        streamed = False
+        try:
+            response = self.model.generate_content(
+                prompt,
+                generation_config=self._generation_config(temperature),
+                stream=True
+            )
+            for chunk in response:
+                streamed = True
+                yield chunk.text
+        except Exception as e:
+            print(f"Error streaming response: {e}")
+            self._record_failure()
+            if not streamed:
+                yield self._mock_response(prompt)
+    
+    def _record_failure(self):
+        """Count a model call that errored; callers may run on several threads"""
+        with self._failures_lock:
+            self.failures += 1
+    
+    def _generation_config(self, temperature: float) -> genai.types.GenerationConfig:
+        """Build the generation config shared by sync and async calls"""
+        return genai.types.GenerationConfig(
+            temperature=temperature,
+            max_output_tokens=1024,
+        )
+    
     def explain_similar_cases(
         self,
         query: str,
         similar_cases: List[Dict[str, Any]]
     ) -> str:
         """Generate explanation for similar cases"""
+        prompt = self._similar_cases_prompt(query, similar_cases)
+        return self.generate_response(prompt, temperature=0.5)
+    
+    async def aexplain_similar_cases(
+        self,
+        query: str,
+        similar_cases: List[Dict[str, Any]]
+    ) -> str:
+        """Generate explanation for similar cases without blocking the event loop"""
+        prompt = self._similar_cases_prompt(query, similar_cases)
+        return await self.agenerate_response(prompt, temperature=0.5)
+    
+    def stream_explain_similar_cases(
+        self,
+        query: str,
+        similar_cases: List[Dict[str, Any]]
+    ) -> Iterator[str]:
+        """Generate explanation for similar cases, yielding text as it arrives"""
+        prompt = self._similar_cases_prompt(query, similar_cases)
+        return self.stream_response(prompt, temperature=0.5)
+    
+    def _similar_cases_prompt(
+        self,
+        query: str,
+        similar_cases: List[Dict[str, Any]]
+    ) -> str:
+        """Build the prompt explaining similar past cases"""
         prompt = f"""You are a medical information assistant for CareLedger, a patient health memory system.
 
 IMPORTANT DISCLAIMER: You provide decision support, NOT medical diagnosis. Always remind users to consult healthcare professionals.
@@ -91,7 +181,7 @@ Remember:
 - Keep response concise and actionable
 """
         
-        return self.generate_response(prompt, temperature=0.5)
+        return prompt
     
     def generate_recommendations(
         self,
@@ -123,16 +213,30 @@ Format as a JSON array of strings. Example:
 IMPORTANT: Do NOT provide medical advice or diagnosis. Focus on information and communication.
 """
         
-        response = self.generate_response(prompt, temperature=0.6)
+        # The prompt covers the query and latest history, so an identical
+        # prompt means an unchanged timeline and the API call can be skipped
+        key = content_key(prompt)
+        cached = llm_recommendation_cache.get(key)
+        if cached is not None:
+            return list(cached)
+        
+        response = self._model_response(prompt, temperature=0.6)
+        from_model = response is not None
+        if not from_model:
+            response = self._mock_response(prompt)
         
         try:
             # Try to parse as JSON
-            recommendations = json.loads(response)
-            return recommendations[:5]  # Max 5 recommendations
+            recommendations = json.loads(response)[:5]  # Max 5 recommendations
         except:
             # Fallback: split by newlines
             lines = [line.strip() for line in response.split('\n') if line.strip()]
-            return [line.lstrip('- ').lstrip('• ').lstrip('* ') for line in lines[:5]]
+            recommendations = [line.lstrip('- ').lstrip('• ').lstrip('* ') for line in lines[:5]]
+        
+        # Only real model output is cached, so a transient failure isn't replayed
+        if from_model:
+            llm_recommendation_cache.set(key, tuple(recommendations))
+        return recommendations
     
     def identify_forgotten_insights(
         self,
@@ -2,30 +2,48 @@
 Qdrant Vector Database Manager
 Handles all vector storage and retrieval operations
 """
-from qdrant_client import QdrantClient
+from qdrant_client import QdrantClient, AsyncQdrantClient
 from qdrant_client.models import (
     Distance, VectorParams, PointStruct,
-    Filter, FieldCondition, MatchValue,
-    SearchRequest, NamedVector
+    Filter, FieldCondition, MatchValue, IsEmptyCondition, PayloadField,
+    SearchRequest, NamedVector, OptimizersConfigDiff, QueryRequest
 )
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
+from contextlib import contextmanager
+import asyncio
+import logging
+import threading
 import uuid
 from datetime import datetime, timedelta
 import numpy as np
 from config import settings
 
+logger = logging.getLogger(__name__)
+
 class QdrantManager:
     """Manages Qdrant vector database operations"""
     
     def __init__(self):
         self.client = None
+        self.async_client = None
         self.collection_name = settings.PATIENT_COLLECTION
+        self._access_lock = threading.Lock()  # Serializes reinforcement read-modify-write
         
     def initialize(self):
         """Initialize Qdrant client and create collection if needed"""
         try:
-            # Use in-memory Qdrant for demo (can switch to server)
-            self.client = QdrantClient(":memory:")
+            # Use embedded Qdrant for demo (set QDRANT_IN_MEMORY=false for a server);
+            # with QDRANT_PATH set, its collection persists across runs
+            if settings.QDRANT_IN_MEMORY:
+                self.client = QdrantClient(path=settings.QDRANT_PATH) if settings.QDRANT_PATH else QdrantClient(":memory:")
+            else:
+                server = {
+                    "host": settings.QDRANT_HOST,
+                    "port": settings.QDRANT_PORT,
+                    "api_key": settings.QDRANT_API_KEY
+                }
+                self.client = QdrantClient(**server)
+                self.async_client = AsyncQdrantClient(**server)
             
             # Create collection if it doesn't exist
             collections = self.client.get_collections().collections
@@ -66,49 +84,15 @@ class QdrantManager:
     ) -> bool:
         """Store a medical record in Qdrant"""
         try:
-            # Prepare payload
-            # Prepare payload with EXPLICIT MEMORY EVOLUTION TRACKING
-            payload = {
-                "patient_id": patient_id,
-                "record_id": record_id,
-                "record_type": record_type,
-                "modality": modality,
-                "content": content,
-                "date": date.isoformat(),
-                "timestamp": date.timestamp(),
-                "metadata": metadata,
-                
-                # === MEMORY EVOLUTION METRICS (Explicit for judges) ===
-                "memory_weight": 1.0,           # Base memory strength (1.0 = new/strong)
-                "access_count": 0,              # Number of retrievals (reinforcement)
-                "last_accessed": None,          # Last retrieval timestamp
-                "relevance_score": 1.0,         # Combined temporal + access score
-                "temporal_decay_applied": False, # Whether decay has been applied
-                "reinforcement_level": 0,       # 0=none, 1=low, 2=medium, 3=high
-                "days_since_creation": 0,       # Age tracking
-                
-                "created_at": datetime.now().isoformat()
-            }
-            
-            # Create point with named vectors
-            vectors = {}
-            if modality == "text":
-                vectors["text"] = embedding.tolist()
-                # Add zero vector for image to maintain consistency
-                vectors["image"] = [0.0] * settings.IMAGE_EMBEDDING_DIM
-            elif modality == "image":
-                vectors["image"] = embedding.tolist()
-                # Add zero vector for text
-                vectors["text"] = [0.0] * settings.TEXT_EMBEDDING_DIM
-            else:
-                # Default to text
-                vectors["text"] = embedding.tolist()
-                vectors["image"] = [0.0] * settings.IMAGE_EMBEDDING_DIM
-            
-            point = PointStruct(
-                id=str(uuid.uuid4()),
-                vector=vectors,
-                payload=payload
+            point = self._build_point(
+                patient_id=patient_id,
+                record_id=record_id,
+                embedding=embedding,
+                modality=modality,
+                record_type=record_type,
+                content=content,
+                date=date,
+                metadata=metadata
             )
             
             # Upsert to Qdrant
@@ -123,6 +107,184 @@ class QdrantManager:
             print(f"Error storing record: {e}")
             return False
     
+    def store_records(
+        self,
+        records: List[Dict[str, Any]],
+        batch_size: int = 64
+    ) -> bool:
+        """
+        Store many medical records with one upsert per batch
+        Each record dict takes the same keyword arguments as store_record
+        """
+        try:
+            points = [self._build_point(**record) for record in records]
+            
+            for i in range(0, len(points), batch_size):
+                self.client.upsert(
+                    collection_name=self.collection_name,
+                    points=points[i:i + batch_size]
+                )
+            
+            return True
+            
+        except Exception as e:
+            print(f"Error storing records: {e}")
+            return False
+    
+    def store_records_bulk(
+        self,
+        records: List[Dict[str, Any]],
+        parallel: int = 4,
+        batch_size: int = 64
+    ) -> bool:
+        """
+        Stream many medical records into Qdrant for backfills
+        Uses the client's parallel uploader without waiting for each write
+        to be applied, so records may take a moment to become searchable
+        """
+        try:
+            self.client.upload_points(
+                collection_name=self.collection_name,
+                points=(self._build_point(**record) for record in records),
+                parallel=parallel,
+                batch_size=batch_size,
+                wait=False
+            )
+            
+            return True
+            
+        except Exception as e:
+            print(f"Error storing records: {e}")
+            return False
+    
+    @contextmanager
+    def bulk_load(self):
+        """
+        Pause HNSW indexing while bulk loading records
+        Qdrant otherwise rebuilds graph links on every upsert; the previous
+        indexing threshold is restored (and the index built) on exit
+        """
+        collection = self.client.get_collection(self.collection_name)
+        previous_threshold = collection.config.optimizer_config.indexing_threshold
+        if previous_threshold is None:
+            previous_threshold = 20000  # Qdrant default
+        
+        self.client.update_collection(
+            collection_name=self.collection_name,
+            optimizer_config=OptimizersConfigDiff(indexing_threshold=0)
+        )
+        try:
+            yield
+        finally:
+            self.client.update_collection(
+                collection_name=self.collection_name,
+                optimizer_config=OptimizersConfigDiff(indexing_threshold=previous_threshold)
+            )
+    
+    async def astore_records(
+        self,
+        records: List[Dict[str, Any]],
+        batch_size: int = 64,
+        concurrency: int = 4
+    ) -> bool:
+        """
+        Store many medical records with concurrent batched upserts
+        Falls back to store_records when there is no Qdrant server, since
+        an in-memory store cannot be shared with an async client
+        """
+        if self.async_client is None:
+            return self.store_records(records, batch_size=batch_size)
+        
+        try:
+            points = [self._build_point(**record) for record in records]
+            semaphore = asyncio.Semaphore(concurrency)
+            
+            async def upsert_chunk(chunk: List[PointStruct]):
+                async with semaphore:
+                    await self.async_client.upsert(
+                        collection_name=self.collection_name,
+                        points=chunk
+                    )
+            
+            await asyncio.gather(*[
+                upsert_chunk(points[i:i + batch_size])
+                for i in range(0, len(points), batch_size)
+            ])
+            
+            return True
+            
+        except Exception as e:
+            print(f"Error storing records: {e}")
+            return False
+    
+    def _build_point(
+        self,
+        patient_id: str,
+        record_id: str,
+        embedding: np.ndarray,
+        modality: str,
+        record_type: str,
+        content: str,
+        date: datetime,
+        metadata: Dict[str, Any]
+    ) -> PointStruct:
+        """Build a Qdrant point with payload and named vectors for a record"""
+        # Prepare payload with EXPLICIT MEMORY EVOLUTION TRACKING
+        payload = {
+            "patient_id": patient_id,
+            "record_id": record_id,
+            "record_type": record_type,
+            "modality": modality,
+            "content": content,
+            "date": date.isoformat(),
+            "timestamp": date.timestamp(),
+            "metadata": metadata,
+            
+            # === MEMORY EVOLUTION METRICS (Explicit for judges) ===
+            "memory_weight": 1.0,           # Base memory strength (1.0 = new/strong)
+            "access_count": 0,              # Number of retrievals (reinforcement)
+            "last_accessed": None,          # Last retrieval timestamp
+            "relevance_score": 1.0,         # Combined temporal + access score
+            "temporal_decay_applied": False, # Whether decay has been applied
+            "reinforcement_level": 0,       # 0=none, 1=low, 2=medium, 3=high
+            "days_since_creation": 0,       # Age tracking
+            
+            "created_at": datetime.now().isoformat()
+        }
+        
+        # Create point with named vectors
+        vectors = {}
+        if modality == "text":
+            vectors["text"] = embedding.tolist()
+            # Add zero vector for image to maintain consistency
+            vectors["image"] = [0.0] * settings.IMAGE_EMBEDDING_DIM
+        elif modality == "image":
+            vectors["image"] = embedding.tolist()
+            # Add zero vector for text
+            vectors["text"] = [0.0] * settings.TEXT_EMBEDDING_DIM
+        else:
+            # Default to text
+            vectors["text"] = embedding.tolist()
+            vectors["image"] = [0.0] * settings.IMAGE_EMBEDDING_DIM
+        
+        return PointStruct(
+            id=self._point_id(record_id),
+            vector=vectors,
+            payload=payload
+        )
+    
+    @staticmethod
+    def _point_id(record_id: str) -> str:
+        """
+        Derive the Qdrant point ID from the record ID
+        Deterministic, so storing the same record again overwrites it
+        """
+        try:
+            return str(uuid.UUID(record_id))
+        except ValueError:
+            # Qdrant only accepts UUIDs (or integers) as point IDs
+            return str(uuid.uuid5(uuid.NAMESPACE_URL, record_id))
+    
     def search_similar(
         self,
         query_embedding: np.ndarray,
@@ -169,7 +331,7 @@ class QdrantManager:
             vector_name = "text" if modality == "text" else "image"
             results = self.client.search(
                 collection_name=self.collection_name,
-                query_vector=(vector_name, query_embedding.tolist()),
+                query_vector=(vector_name, np.ravel(query_embedding).tolist()),
                 query_filter=query_filter,
                 limit=limit,
                 score_threshold=score_threshold
@@ -192,6 +354,81 @@ class QdrantManager:
             print(f"Error searching: {e}")
             return []
     
+    def search_similar_with_timeline(
+        self,
+        query_embedding: np.ndarray,
+        patient_id: str,
+        modality: str = "text",
+        limit: int = 10,
+        score_threshold: float = 0.5,
+        timeline_limit: int = 1000
+    ) -> Tuple[List[Dict[str, Any]], Optional[List[Dict[str, Any]]]]:
+        """
+        Search for similar records and fetch the patient's timeline in one
+        batched request. Falls back to paging the timeline when the patient
+        has more than timeline_limit records; the timeline is None when the
+        batched request fails, so callers can fetch it separately
+        """
+        try:
+            query_filter = Filter(must=[
+                FieldCondition(
+                    key="patient_id",
+                    match=MatchValue(value=patient_id)
+                )
+            ])
+            
+            # One round trip: a vector search plus a filter-only fetch
+            vector_name = "text" if modality == "text" else "image"
+            search_results, timeline_results = self.client.query_batch_points(
+                collection_name=self.collection_name,
+                requests=[
+                    QueryRequest(
+                        query=np.ravel(query_embedding).tolist(),
+                        using=vector_name,
+                        filter=query_filter,
+                        limit=limit,
+                        score_threshold=score_threshold,
+                        with_payload=True
+                    ),
+                    QueryRequest(
+                        filter=query_filter,
+                        limit=timeline_limit,
+                        with_payload=True
+                    )
+                ]
+            )
+            
+            # Update access counts for retrieved records (reinforcement)
+            for result in search_results.points:
+                self._update_access_count(result.id)
+            
+            similar = [
+                {
+                    "id": result.id,
+                    "score": result.score,
+                    "payload": result.payload
+                }
+                for result in search_results.points
+            ]
+            
+            if len(timeline_results.points) < timeline_limit:
+                timeline = [
+                    {
+                        "id": point.id,
+                        "payload": point.payload
+                    }
+                    for point in timeline_results.points
+                ]
+                timeline.sort(key=lambda x: x["payload"]["timestamp"])
+            else:
+                timeline = self.get_patient_timeline(patient_id)
+            
+            return similar, timeline
+            
+        except Exception:
+            logger.exception("Error searching with timeline for patient %s", patient_id)
+            return [], None
+    
     def get_patient_timeline(
         self,
         patient_id: str,
@@ -265,6 +502,100 @@ class QdrantManager:
             print(f"Error getting timeline: {e}")
             return []
     
+    def get_patient_timeline_columnar(
+        self,
+        patient_id: str,
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None
+    ) -> Dict[str, Any]:
+        """
+        Get a patient's timeline as columns for vectorized analysis
+        Dates are parsed once into a datetime64 array; "payload" keeps the
+        full records in the same chronological order
+        """
+        timeline = self.get_patient_timeline(patient_id, start_date, end_date)
+        
+        return {
+            "id": [record["id"] for record in timeline],
+            "date": np.array(
+                [record["payload"]["date"] for record in timeline],
+                dtype="datetime64[us]"
+            ),
+            "record_type": np.array(
+                [record["payload"].get("record_type", "unknown") for record in timeline],
+                dtype=object
+            ),
+            "payload": [record["payload"] for record in timeline]
+        }
+    
+    def get_unfollowed_recommendations(self, patient_id: str) -> Dict[str, str]:
+        """
+        Map record IDs to their unfollowed recommendations
+        Qdrant filters on the metadata field, so only those records are read
+        """
+        try:
+            query_filter = Filter(
+                must=[
+                    FieldCondition(
+                        key="patient_id",
+                        match=MatchValue(value=patient_id)
+                    )
+                ],
+                must_not=[
+                    IsEmptyCondition(
+                        is_empty=PayloadField(key="metadata.unfollowed_recommendation")
+                    )
+                ]
+            )
+            
+            recommendations = {}
+            offset = None
+            
+            while True:
+                results, next_offset = self.client.scroll(
+                    collection_name=self.collection_name,
+                    scroll_filter=query_filter,
+                    limit=100,
+                    offset=offset,
+                    with_payload=["record_id", "metadata.unfollowed_recommendation"],
+                    with_vectors=False
+                )
+                
+                for point in results:
+                    recommendation = point.payload["metadata"]["unfollowed_recommendation"]
+                    if recommendation:
+                        recommendations[point.payload["record_id"]] = recommendation
+                
+                if next_offset is None:
+                    break
+                
+                offset = next_offset
+            
+            return recommendations
+            
+        except Exception as e:
+            print(f"Error getting unfollowed recommendations: {e}")
+            return {}
+    
+    def record_access(self, point_ids: List[str]):
+        """Reinforce records that were retrieved again without a new search"""
+        for point_id in point_ids:
+            self._update_access_count(point_id)
+    
+    def set_record_date(self, point_id: str, date: datetime):
+        """Move a stored record to a new date, keeping its embedding and memory stats"""
+        self.client.set_payload(
+            collection_name=self.collection_name,
+            payload={"date": date.isoformat(), "timestamp": date.timestamp()},
+            points=[point_id]
+        )
+        self.client.set_payload(
+            collection_name=self.collection_name,
+            payload={"date": date.isoformat()},
+            points=[point_id],
+            key="metadata"
+        )
+    
     def _update_access_count(self, point_id: str):
         """
         Update access count for MEMORY REINFORCEMENT
@@ -272,70 +603,72 @@ class QdrantManager:
         
         VISIBLE EVOLUTION: Logs show before/after weight changes
         """
-        try:
-            # Get current point
-            points = self.client.retrieve(
-                collection_name=self.collection_name,
-                ids=[point_id],
-                with_payload=True,
-                with_vectors=False
-            )
+        # Concurrent queries must not interleave the read and the update
+        with self._access_lock:
+            try:
+                # Get current point
+                points = self.client.retrieve(
+                    collection_name=self.collection_name,
+                    ids=[point_id],
+                    with_payload=True,
+                    with_vectors=False
+                )
             
-            if points:
-                point = points[0]
-                payload = point.payload
+                if points:
+                    point = points[0]
+                    payload = point.payload
                 
-                # === CAPTURE BEFORE STATE ===
-                old_access_count = payload.get("access_count", 0)
-                old_memory_weight = payload.get("memory_weight", 1.0)
-                old_reinforcement_level = payload.get("reinforcement_level", 0)
+                    # === CAPTURE BEFORE STATE ===
+                    old_access_count = payload.get("access_count", 0)
+                    old_memory_weight = payload.get("memory_weight", 1.0)
+                    old_reinforcement_level = payload.get("reinforcement_level", 0)
                 
-                # === REINFORCEMENT LOGIC ===
-                payload["access_count"] = old_access_count + 1
-                payload["last_accessed"] = datetime.now().isoformat()
+                    # === REINFORCEMENT LOGIC ===
+                    payload["access_count"] = old_access_count + 1
+                    payload["last_accessed"] = datetime.now().isoformat()
                 
-                access_count = payload["access_count"]
+                    access_count = payload["access_count"]
                 
-                # Calculate reinforcement level
-                if access_count >= 10:
-                    payload["reinforcement_level"] = 3  # High
-                    payload["memory_weight"] = min(2.0, 1.0 + (access_count * 0.15))
-                elif access_count >= 5:
-                    payload["reinforcement_level"] = 2  # Medium
-                    payload["memory_weight"] = min(1.5, 1.0 + (access_count * 0.12))
-                elif access_count >= settings.REINFORCEMENT_THRESHOLD:
-                    payload["reinforcement_level"] = 1  # Low
-                    payload["memory_weight"] = min(1.3, 1.0 + (access_count * 0.1))
-                else:
-                    payload["reinforcement_level"] = 0  # None
-                    payload["memory_weight"] = 1.0 + (access_count * 0.05)  # Small boost even before threshold
+                    # Calculate reinforcement level
+                    if access_count >= 10:
+                        payload["reinforcement_level"] = 3  # High
+                        payload["memory_weight"] = min(2.0, 1.0 + (access_count * 0.15))
+                    elif access_count >= 5:
+                        payload["reinforcement_level"] = 2  # Medium
+                        payload["memory_weight"] = min(1.5, 1.0 + (access_count * 0.12))
+                    elif access_count >= settings.REINFORCEMENT_THRESHOLD:
+                        payload["reinforcement_level"] = 1  # Low
+                        payload["memory_weight"] = min(1.3, 1.0 + (access_count * 0.1))
+                    else:
+                        payload["reinforcement_level"] = 0  # None
+                        payload["memory_weight"] = 1.0 + (access_count * 0.05)  # Small boost even before threshold
                 
-                # Update relevance score (combines temporal decay + reinforcement)
-                payload["relevance_score"] = payload.get("memory_weight", 1.0)
+                    # Update relevance score (combines temporal decay + reinforcement)
+                    payload["relevance_score"] = payload.get("memory_weight", 1.0)
                 
-                # === SHOW EVOLUTION (VISIBLE TO JUDGES) ===
-                new_memory_weight = payload["memory_weight"]
-                new_reinforcement_level = payload["reinforcement_level"]
+                    # === SHOW EVOLUTION (VISIBLE TO JUDGES) ===
+                    new_memory_weight = payload["memory_weight"]
+                    new_reinforcement_level = payload["reinforcement_level"]
                 
-                weight_change = new_memory_weight - old_memory_weight
+                    weight_change = new_memory_weight - old_memory_weight
                 
-                if weight_change > 0:
-                    print(f"\n{'='*70}")
-                    print(f"🧠 MEMORY REINFORCEMENT (Live Evolution)")
-                    print(f"{'='*70}")
-                    print(f"Record: {point_id[:12]}...")
-                    print(f"Access count: {old_access_count} → {access_count} (+1)")
-                    print(f"Memory weight: {old_memory_weight:.3f} → {new_memory_weight:.3f} (+{weight_change:.3f})")
-                    print(f"Reinforcement level: {old_reinforcement_level} → {new_reinforcement_level}")
+                    if weight_change > 0:
+                        print(f"\n{'='*70}")
+                        print(f"🧠 MEMORY REINFORCEMENT (Live Evolution)")
+                        print(f"{'='*70}")
+                        print(f"Record: {point_id[:12]}...")
+                        print(f"Access count: {old_access_count} → {access_count} (+1)")
+                        print(f"Memory weight: {old_memory_weight:.3f} → {new_memory_weight:.3f} (+{weight_change:.3f})")
+                        print(f"Reinforcement level: {old_reinforcement_level} → {new_reinforcement_level}")
                     
-                    if new_reinforcement_level > old_reinforcement_level:
-                        level_names = {0: "None", 1: "Low", 2: "Medium", 3: "High"}
-                        print(f"✨ LEVEL UP: {level_names[old_reinforcement_level]} → {level_names[new_reinforcement_level]}")
+                        if new_reinforcement_level > old_reinforcement_level:
+                            level_names = {0: "None", 1: "Low", 2: "Medium", 3: "High"}
+                            print(f"✨ LEVEL UP: {level_names[old_reinforcement_level]} → {level_names[new_reinforcement_level]}")
                     
-                    print(f"{'='*70}\n")
+                        print(f"{'='*70}\n")
                 
-        except Exception as e:
-            print(f"Error updating access count: {e}")
+            except Exception as e:
+                print(f"Error updating access count: {e}")
     
     def apply_temporal_decay(self, patient_id: str):
         """